@@ -0,0 +1,60 @@
+import asyncio
+import weakref
+
+# event loop -> {SessionPool: asyncio.Semaphore}
+_limits = weakref.WeakKeyDictionary()
+
+def _limit(pool):
+    # Semaphores belong to one event loop, so keep one per loop and pool
+    per_pool = _limits.setdefault(asyncio.get_running_loop(), {})
+    semaphore = per_pool.get(pool)
+    if semaphore is None:
+        semaphore = per_pool[pool] = asyncio.Semaphore(pool.maxsize if pool is not None else 10)
+    return semaphore
+
+class AsyncQuery:
+    """Awaitable wrapper around Query with the same fluent API.
+
+    Not asyncio-native: every request runs the blocking Query call on a
+    thread of the event loop's default executor (asyncio.to_thread), so it
+    shares the Query's connection pool, headers and error handling. Many
+    AsyncQuery calls can be awaited concurrently, e.g. with asyncio.gather();
+    at most the pool's maxsize of them run at once per event loop, so the
+    threads never need more connections than the pool keeps open.
+    """
+    def __init__(self, query):
+        self.query = query
+
+    def filter(self, **kwargs):
+        self.query.filter(**kwargs)
+        return self
+
+    def paginate(self, page=0, size=100):
+        self.query.paginate(page=page, size=size)
+        return self
+
+    def order_by(self, field, direction="asc"):
+        self.query.order_by(field, direction)
+        return self
+
+    async def get(self, endpoint, params=None):
+        return await self._run(self.query.get, endpoint, params)
+
+    async def post(self, endpoint, data=None, json=None):
+        return await self._run(self.query.post, endpoint, data=data, json=json)
+
+    async def put(self, endpoint, data=None, json=None):
+        return await self._run(self.query.put, endpoint, data=data, json=json)
+
+    async def delete(self, endpoint):
+        return await self._run(self.query.delete, endpoint)
+
+    async def fetch(self, endpoint):
+        return await self.get(endpoint)
+
+    async def post_fetch(self, endpoint, data=None, json=None):
+        return await self.post(endpoint, data=data, json=json)
+
+    async def _run(self, func, *args, **kwargs):
+        async with _limit(self.query.pool):
+            return await asyncio.to_thread(func, *args, **kwargs)
@@ -1,12 +1,242 @@
+import copy
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import requests
+from requests.adapters import HTTPAdapter
+import jsonio
+
+class SessionPool:
+    """Keep-alive connection pool shared by Query instances.
+
+    Every thread gets its own requests.Session (cookies and other session
+    state are not thread-safe), but all of them mount the same HTTPAdapter,
+    so TCP/TLS connections are pooled and reused across threads and calls.
+
+    pool_connections: number of distinct hosts to keep connection pools for
+    pool_maxsize:     max connections kept open per host
+    pool_block:       block when all connections to a host are in use instead
+                      of opening (and discarding) extra ones
+    """
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False):
+        self.maxsize = pool_maxsize
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+        )
+        self._local = threading.local()
+
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            self._local.session = session
+        return session
+
+    def close(self):
+        self.adapter.close()
+
+class RequestPolicy:
+    """Adaptive per-endpoint timeouts and hedging of idempotent GETs.
+
+    Keeps a rolling window of the last `window` successful request latencies
+    per endpoint, retrievalMode and order of magnitude of the page size, so
+    cheap lookups do not set the pace for aggregations or large pages. Once a
+    window has min_samples of them:
+    - adaptive_timeout: the timeout becomes timeout_multiplier x the
+      timeout_percentile latency, clamped to [min_timeout, Query.timeout];
+      a request that times out under it is retried once with the full
+      Query.timeout, so none gives up before Query.timeout
+    - hedge: a GET to one of hedge_endpoints still running after the
+      hedge_percentile latency gets a duplicate request, and whichever
+      answers first is used
+    The hedge delay counts from when the first attempt starts sending, not
+    from when it was queued for a worker, and at most max_hedges_in_flight
+    duplicates run at once; beyond that requests are simply not hedged.
+    Share one instance between Query objects so the windows fill up.
+    """
+    def __init__(self, hedge=True, hedge_endpoints=("/readings", "/datapoints", "/control-values"),
+                 hedge_percentile=95, adaptive_timeout=True, timeout_percentile=99,
+                 timeout_multiplier=3.0, min_timeout=1.0, window=200, min_samples=20,
+                 max_hedge_workers=16, max_hedges_in_flight=4):
+        self.hedge = hedge
+        self.hedge_endpoints = set(hedge_endpoints)
+        self.hedge_percentile = hedge_percentile
+        self.adaptive_timeout = adaptive_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout = min_timeout
+        self.window = window
+        self.min_samples = min_samples
+        self.hedges_sent = 0
+        self.executor = ThreadPoolExecutor(max_workers=max_hedge_workers, thread_name_prefix="hedge")
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges_in_flight)
+
+    # Latency window of a request: (endpoint, retrievalMode, digits of size)
+    @staticmethod
+    def key(endpoint, params):
+        params = params or {}
+        size = params.get("size")
+        return endpoint, params.get("retrievalMode"), len(str(size)) if size is not None else None
+
+    def observe(self, key, seconds):
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, q):
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def timeout_for(self, key, default):
+        if not self.adaptive_timeout:
+            return default
+        latency = self.percentile(key, self.timeout_percentile)
+        if latency is None:
+            return default
+        return min(default, max(self.min_timeout, latency * self.timeout_multiplier))
+
+    # Seconds to wait before hedging this request, or None to not hedge it
+    def hedge_delay(self, method, key):
+        if not self.hedge or method != "GET" or key[0] not in self.hedge_endpoints:
+            return None
+        return self.percentile(key, self.hedge_percentile)
+
+    # Claim a slot for one duplicate request; False when max_hedges_in_flight are running
+    def start_hedge(self):
+        if not self._hedge_slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.hedges_sent += 1
+        return True
+
+    def end_hedge(self):
+        self._hedge_slots.release()
+
+def _close_response(attempt):
+    if attempt.exception() is None:
+        attempt.result().close()
+
+class ResponseCache:
+    """LRU cache of decoded GET responses with per-endpoint TTLs and HTTP revalidation.
+
+    Entries are keyed by endpoint plus query params, and the cache holds at
+    most max_bytes of response bodies, evicting the least recently used.
+    ttls maps an endpoint prefix (longest match wins) to the seconds a
+    response is served without asking the server; endpoints without a TTL
+    are not cached. Once the TTL is over, a response that came with an ETag or
+    Last-Modified header is revalidated with If-None-Match /
+    If-Modified-Since, and a 304 reuses the cached body without transfer or
+    JSON parsing. Callers get deep copies, so they may modify the results.
+    A successful POST / PUT / DELETE drops the cached entries of that
+    endpoint's resource, and of the resources listed for it in invalidates.
+    Share one instance between Query objects.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttls=None, invalidates=None):
+        self.max_bytes = max_bytes
+        self.ttls = {"/datapoints": 60, "/datapoint-prognoses": 60} if ttls is None else dict(ttls)
+        # Posting a prognosis changes the datapoint's lastPrognosisId
+        self.invalidates = ({"/datapoint-prognoses": ("/datapoints",)} if invalidates is None
+                            else dict(invalidates))
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()  # key -> [result, etag, last_modified, expires, size]
+        self._lock = threading.Lock()
+
+    def ttl_for(self, endpoint):
+        prefix = max((p for p in self.ttls if endpoint.startswith(p)), key=len, default=None)
+        return None if prefix is None else self.ttls[prefix]
+
+    @staticmethod
+    def key(endpoint, params):
+        return endpoint, tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+
+    # (fresh copy or None, conditional request headers)
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, {}
+            self._entries.move_to_end(key)
+            if time.monotonic() < entry[3]:
+                self.hits += 1
+                return copy.deepcopy(entry[0]), {}
+            headers = {}
+            if entry[1]:
+                headers["If-None-Match"] = entry[1]
+            if entry[2]:
+                headers["If-Modified-Since"] = entry[2]
+            return None, headers
+
+    # After a 304: extend the entry's lifetime and return a copy of its body
+    def revalidate(self, key, response_headers):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.revalidated += 1
+            entry[1] = response_headers.get("ETag", entry[1])
+            entry[2] = response_headers.get("Last-Modified", entry[2])
+            entry[3] = time.monotonic() + self.ttl_for(key[0])
+            self._entries.move_to_end(key)
+            return copy.deepcopy(entry[0])
+
+    def store(self, key, result, response_headers, size):
+        ttl = self.ttl_for(key[0])
+        etag = response_headers.get("ETag")
+        last_modified = response_headers.get("Last-Modified")
+        if size > self.max_bytes or (ttl <= 0 and not etag and not last_modified):
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[4]
+            self._entries[key] = [copy.deepcopy(result), etag, last_modified, time.monotonic() + ttl, size]
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted[4]
+
+    def invalidate(self, endpoint):
+        resource = "/" + endpoint.strip("/").split("/", 1)[0]
+        prefixes = (resource,) + tuple(self.invalidates.get(resource, ()))
+        with self._lock:
+            for key in [k for k in self._entries if k[0].startswith(prefixes)]:
+                self.size -= self._entries.pop(key)[4]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
 
 class Query:
-    def __init__(self, base_url, headers=None, timeout=10, logger=None):
+    def __init__(self, base_url, headers=None, timeout=10, logger=None, pool=None, metrics=None, auth=None,
+                 policy=None, cache=None):
         self.base_url = base_url.rstrip('/')
         self.headers = headers or {}
         self.params = {}
         self.timeout = timeout
         self.logger = logger 
+        self.pool = pool
+        self.metrics = metrics
+        self.auth = auth  # Optional TokenManager supplying the bearer token
+        self.policy = policy  # Optional RequestPolicy (adaptive timeouts, hedging)
+        self.cache = cache  # Optional ResponseCache for GETs
 
     def post(self, endpoint, data=None, json=None):
         return self._request("POST", endpoint, data=data, json=json)
@@ -32,11 +262,22 @@ class Query:
         self.params["sort"] = f"{field},{direction}"
         return self
 
-    def get(self, endpoint, params=None):
+    # parser: optional callable receiving the streamed requests.Response and
+    # returning the decoded result, e.g. to parse a large body incrementally
+    # instead of loading it whole (see TimeSeries.from_json)
+    def get(self, endpoint, params=None, parser=None):
         combined_params = self.params.copy()
         if params:
             combined_params.update(params)
-        response = self._request("GET", endpoint, params=combined_params)
+        cache_key = None
+        if self.cache is not None and parser is None and self.cache.ttl_for(endpoint) is not None:
+            cache_key = self.cache.key(endpoint, combined_params)
+            cached, conditional_headers = self.cache.lookup(cache_key)
+            if cached is not None:
+                self.params.clear()
+                return cached
+        response = self._request("GET", endpoint, params=combined_params, parser=parser,
+                                 cache_key=cache_key, extra_headers=conditional_headers if cache_key else None)
         self.params.clear()  
         return response
 
@@ -46,30 +287,145 @@ class Query:
     def post_fetch(self, endpoint, data=None, json=None):
         return self.post(endpoint, data=data, json=json)
 
-    def _request(self, method, endpoint, **kwargs):
+    # cache_key / extra_headers: set by get() for responses kept in self.cache
+    def _request(self, method, endpoint, parser=None, cache_key=None, extra_headers=None, **kwargs):
         url = f"{self.base_url}{endpoint}"
         self.logger.debug(f"Request url: {url} kwargs: {kwargs}")
+        status = None
+        size = 0
+        error = "unhandled"
+        start = time.perf_counter()
+        if parser is not None:
+            kwargs["stream"] = True
         try:
-            response = requests.request(
-                method,
-                url,
-                headers=self.headers,
-                timeout=self.timeout,
-                **kwargs
-            )
+            response = self._send(method, url, endpoint, extra_headers, **kwargs)
+            status = response.status_code
             response.raise_for_status()
-            
-            self.logger.debug(
-                "HTTP %s %s -> %s %s",
-                method, response.url, response.status_code, response.text[:500]
-            )   
-
-            if response.content:
-                return response.json()
-            return None
+
+            if cache_key is not None and status == 304:
+                result = self.cache.revalidate(cache_key, response.headers)
+                self.logger.debug("HTTP %s %s -> 304, using cached response", method, response.url)
+            elif parser is not None:
+                response.raw.decode_content = True
+                result = parser(response)
+                size = response.raw.tell()
+                self.logger.debug("HTTP %s %s -> %s (streamed, %d bytes)",
+                                  method, response.url, response.status_code, size)
+            else:
+                content = response.content
+                size = len(content)
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug(
+                        "HTTP %s %s -> %s %s",
+                        method, response.url, response.status_code,
+                        content[:500].decode(response.encoding or "utf-8", errors="replace")
+                    )
+                result = jsonio.loads(content) if content else None
+                if cache_key is not None:
+                    self.cache.store(cache_key, result, response.headers, size)
+                elif self.cache is not None and method != "GET":
+                    self.cache.invalidate(endpoint)
+            error = None
+            return result
         except requests.HTTPError as e:
+            error = "HTTPError"
+            size = len(e.response.content)
             self.logger.error(f"{method} {url} – {response.status_code}")
             self.logger.error(f"HTTP error: {e.response.status_code} {e.response.text}")
         except requests.RequestException as e:
+            error = type(e).__name__
             self.logger.error(f"Request failed: {e}")
+        except jsonio.DECODE_ERRORS as e:
+            error = "JSONDecodeError"
+            self.logger.error(f"{method} {url} – invalid JSON response: {e}")
+        finally:
+            if self.metrics is not None:
+                retrieval_mode = (kwargs.get("params") or {}).get("retrievalMode")
+                self.metrics.record_request(method, endpoint, retrieval_mode, status,
+                                            time.perf_counter() - start, size, error)
         return None
+
+    # Send one request; with auth, a 401 triggers a token refresh and one retry
+    def _send(self, method, url, endpoint, extra_headers=None, **kwargs):
+        token = None
+        for attempt in range(2):
+            headers = {**self.headers, **extra_headers} if extra_headers else self.headers
+            if self.auth is not None:
+                token = self.auth.get_token()
+                headers = {**headers, "Authorization": f"Bearer {token}"}
+            response = self._send_hedged(method, url, endpoint, headers, kwargs)
+            if response.status_code != 401 or self.auth is None or attempt > 0:
+                return response
+            self.logger.info(f"{method} {endpoint} returned 401, refreshing access token")
+            self.auth.refresh(stale_token=token)
+        return response
+
+    # With a RequestPolicy, send a duplicate when the first attempt is slower
+    # than usual for this kind of request and return whichever response comes
+    # first; a timeout under the adaptive timeout is retried with self.timeout
+    def _send_hedged(self, method, url, endpoint, headers, kwargs):
+        policy = self.policy
+        if policy is None:
+            return self._send_once(method, url, None, headers, self.timeout, kwargs)
+        key = policy.key(endpoint, kwargs.get("params"))
+        timeout = policy.timeout_for(key, self.timeout)
+        try:
+            return self._send_raced(method, url, key, headers, timeout, kwargs)
+        except requests.Timeout:
+            if timeout >= self.timeout:
+                raise
+            self.logger.warning(f"{method} {endpoint} timed out after the adaptive {timeout:.1f} s, "
+                                f"retrying with {self.timeout} s")
+            return self._send_once(method, url, key, headers, self.timeout, kwargs)
+
+    def _send_raced(self, method, url, key, headers, timeout, kwargs):
+        policy = self.policy
+        delay = policy.hedge_delay(method, key)
+        if delay is None:
+            return self._send_once(method, url, key, headers, timeout, kwargs)
+
+        # The hedge delay starts when the first attempt leaves the queue
+        started = threading.Event()
+
+        def first_attempt():
+            started.set()
+            return self._send_once(method, url, key, headers, timeout, kwargs)
+
+        attempts = {policy.executor.submit(first_attempt)}
+        started.wait()
+        done, _ = wait(attempts, timeout=delay)
+        if not done and policy.start_hedge():
+            self.logger.debug(f"Hedging {method} {key[0]} after {delay:.3f} s")
+            hedge = policy.executor.submit(self._send_once, method, url, key, headers, timeout, kwargs)
+            hedge.add_done_callback(lambda _: policy.end_hedge())
+            attempts.add(hedge)
+        error = None
+        while attempts:
+            done, attempts = wait(attempts, return_when=FIRST_COMPLETED)
+            for attempt in done:
+                try:
+                    response = attempt.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                # Release the losers' connections (held open with stream=True)
+                for loser in attempts | (done - {attempt}):
+                    loser.add_done_callback(_close_response)
+                return response
+        raise error
+
+    # key: the request's RequestPolicy latency window
+    def _send_once(self, method, url, key, headers, timeout, kwargs):
+        # Without a pool, fall back to a one-off connection per request
+        http = self.pool.session() if self.pool is not None else requests
+        start = time.perf_counter()
+        response = http.request(
+            method,
+            url,
+            headers=headers,
+            timeout=timeout,
+            **kwargs
+        )
+        if self.policy is not None and response.status_code < 500:
+            self.policy.observe(key, time.perf_counter() - start)
+        return response
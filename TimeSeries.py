@@ -0,0 +1,103 @@
+from array import array
+import numpy as np
+import jsonio
+from timestamps import epoch_us, epoch_us_many, from_epoch_us, format_epoch_us, format_epoch_us_many
+
+_PARSE_CHUNK = 16384
+
+class TimeSeries:
+    """Compact columnar readings series.
+
+    Holds reading times as an int64 array of microseconds since the Unix epoch
+    (UTC) and values as a float64 array (missing values are NaN), instead of a
+    list of {"id", "time", "value", "datapointId"} dicts. to_numpy() and
+    to_pandas() expose the arrays without copying them.
+    """
+    __slots__ = ("epoch_us", "values", "datapoint_id")
+
+    def __init__(self, epoch_us, values, datapoint_id=None):
+        self.epoch_us = np.asarray(epoch_us, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64)
+        if self.epoch_us.shape != self.values.shape or self.epoch_us.ndim != 1:
+            raise ValueError("epoch_us and values must be 1-D arrays of equal length")
+        self.datapoint_id = datapoint_id
+
+    @classmethod
+    def from_readings(cls, readings, datapoint_id=None):
+        """Build from API readings: a list of {"time": ..., "value": ...} dicts."""
+        count = len(readings)
+        times = epoch_us_many([r["time"] for r in readings])
+        values = np.fromiter(
+            (np.nan if r.get("value") is None else r["value"] for r in readings),
+            dtype=np.float64, count=count,
+        )
+        if datapoint_id is None and readings:
+            datapoint_id = readings[0].get("datapointId")
+        return cls(times, values, datapoint_id)
+
+    @classmethod
+    def from_json(cls, source, datapoint_id=None):
+        """Build from a JSON array of readings: bytes, or a binary file object such as a streamed response body.
+
+        With ijson installed, file objects are parsed incrementally straight
+        into the time / value arrays, so neither the raw body nor a list of
+        reading dicts is ever held in memory, at about 2-3x the parse time of
+        orjson plus from_readings; use it only for pages too large to decode
+        whole. Otherwise the body is read and decoded in one go (with orjson
+        when available).
+        """
+        if jsonio.ijson is None or not hasattr(source, "read"):
+            data = source.read() if hasattr(source, "read") else source
+            return cls.from_readings(jsonio.loads(data) if data else [], datapoint_id)
+
+        times = array("q")
+        values = array("d")
+        pending = []
+        for reading in jsonio.ijson.items(source, "item", use_float=True):
+            # Each reading dict is dropped as soon as its time and value are taken;
+            # time strings are parsed in bulk, a chunk at a time
+            pending.append(reading["time"])
+            if len(pending) == _PARSE_CHUNK:
+                times.frombytes(epoch_us_many(pending).tobytes())
+                pending.clear()
+            value = reading.get("value")
+            values.append(np.nan if value is None else value)
+            if datapoint_id is None:
+                datapoint_id = reading.get("datapointId")
+        times.frombytes(epoch_us_many(pending).tobytes())
+        return cls(np.frombuffer(times, dtype=np.int64), np.frombuffer(values, dtype=np.float64), datapoint_id)
+
+    def __len__(self):
+        return len(self.epoch_us)
+
+    def __repr__(self):
+        return f"TimeSeries(datapoint_id={self.datapoint_id!r}, points={len(self)})"
+
+    def sorted(self):
+        """Copy ordered by time (stable for equal timestamps)."""
+        order = np.argsort(self.epoch_us, kind="stable")
+        return TimeSeries(self.epoch_us[order], self.values[order], self.datapoint_id)
+
+    def to_numpy(self):
+        """(epoch_us, values) arrays, not copied."""
+        return self.epoch_us, self.values
+
+    def to_pandas(self, tz=None):
+        """pandas Series indexed by a DatetimeIndex of UTC times, sharing this series' arrays.
+
+        The index is naive (UTC wall time) so it can view epoch_us directly;
+        pass tz (e.g. "UTC" or "Europe/Tallinn") for an aware index, which
+        costs one copy of the time column.
+        """
+        import pandas as pd
+        index = pd.DatetimeIndex(self.epoch_us.view("datetime64[us]"), copy=False)
+        if tz is not None:
+            index = index.tz_localize("UTC").tz_convert(tz)
+        return pd.Series(self.values, index=index, copy=False, name=self.datapoint_id)
+
+    def to_readings(self):
+        """List of {"time", "value", "datapointId"} dicts with ISO-8601 UTC times, as the API returns them."""
+        return [
+            {"time": t, "value": v, "datapointId": self.datapoint_id}
+            for t, v in zip(format_epoch_us_many(self.epoch_us), self.values.tolist())
+        ]
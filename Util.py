@@ -2,6 +2,9 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Union
 import math
 import random
+import numpy as np
+from TimeSeries import TimeSeries
+from timestamps import epoch_us, epoch_us_many, from_epoch_us, from_epoch_us_many, format_epoch_us_many
 
 class TaskFailException(Exception):
     """Exception for use in forecast validation."""
@@ -11,7 +14,10 @@ def calculate_count(prs, start, interval_seconds):
     if not prs:
         return 0
 
-    first_time = datetime.fromisoformat(prs[0]["time"]) #.replace("+00:00", "Z"))
+    if isinstance(prs, TimeSeries):
+        first_time = from_epoch_us(prs.epoch_us[0])
+    else:
+        first_time = parse_time(prs[0]["time"])
     start_difference = int((first_time - start).total_seconds())
     print(f"first_time: {first_time} --- start: {start} --- start difference: {start_difference}")
     if start_difference > 0: 
@@ -39,12 +45,31 @@ def parse_time(time_val: Union[str, datetime]) -> datetime:
     if isinstance(time_val, datetime):
         return time_val
     elif isinstance(time_val, str):
-        return datetime.fromisoformat(time_val) #.replace("Z", "+00:00"))
+        # Keeps the string's offset; a string without one gives a naive datetime
+        return datetime.fromisoformat(time_val.replace("Z", "+00:00"))
     else:
         raise TypeError("time must be string or datetime")
 
+def _sorted_readings(prs, end: datetime):
+    """Epoch-microsecond times and values of readings at or before end, sorted by time."""
+    if isinstance(prs, TimeSeries):
+        times, values = prs.to_numpy()
+    else:
+        times = epoch_us_many([r["time"] for r in prs])
+        values = None
+    keep = np.flatnonzero(times <= epoch_us(end))  # lubame ka enne starti
+    order = keep[np.argsort(times[keep], kind="stable")]
+    if values is not None:
+        return times[order], values[order].tolist()
+    return times[order], [prs[i]["value"] for i in order.tolist()]
+
+def _carry_forward_index(times, start: datetime, interval, count) -> np.ndarray:
+    """For each slot start + i*interval, index of the last reading at or before it (-1 if none)."""
+    slots = epoch_us(start) + np.arange(count, dtype=np.int64) * round(interval * 1_000_000)
+    return np.searchsorted(times, slots, side="right") - 1
+
 def generate_result_series(
-    prs: List[Dict[str, Union[str, datetime, float]]],
+    prs: Union[List[Dict[str, Union[str, datetime, float]]], TimeSeries],
     start: datetime,
     end: datetime,
     interval: int,
@@ -58,31 +83,16 @@ def generate_result_series(
     total_seconds = (end - start).total_seconds()
     count = int(total_seconds // interval) + 1  # include start
 
-    for r in prs:
-        r["time"] = parse_time(r["time"])
-
-    prs = [r for r in prs if r["time"] <= end]  # lubame ka enne starti
-    prs.sort(key=lambda r: r["time"])
-
-    result = []
-    current_idx = 0
-    last_value = initial
+    times, values = _sorted_readings(prs, end)
+    idx = _carry_forward_index(times, start, interval, count)
 
-    for i in range(count):
-        current_time = start + timedelta(seconds=i * interval)
-
-        while current_idx + 1 < len(prs) and prs[current_idx + 1]["time"] <= current_time:
-            current_idx += 1
-
-        if prs and prs[current_idx]["time"] <= current_time:
-            last_value = prs[current_idx]["value"]
-
-        result.append({"time": current_time, "value": last_value})
-
-    return result
+    return [
+        {"time": start + timedelta(seconds=i * interval), "value": values[j] if j >= 0 else initial}
+        for i, j in enumerate(idx.tolist())
+    ]
 
 def extract_prognosis_values(
-    prs: List[Dict[str, Union[str, datetime, float]]],
+    prs: Union[List[Dict[str, Union[str, datetime, float]]], TimeSeries],
     label: str,
     start: Union[str, datetime],
     end: Union[str, datetime],
@@ -92,9 +102,9 @@ def extract_prognosis_values(
         raise TaskFailException(f"No proper {label}.")
 
     if isinstance(start, str):
-        start = datetime.fromisoformat(start.replace("Z", "+00:00"))
+        start = parse_time(start)
     if isinstance(end, str):
-        end = datetime.fromisoformat(end.replace("Z", "+00:00"))
+        end = parse_time(end)
 
     if start >= end:
         raise ValueError("start must be before end")
@@ -104,65 +114,205 @@ def extract_prognosis_values(
     total_seconds = (end - start).total_seconds()
     count = int(total_seconds // interval) + 1
 
-    for r in prs:
-        r["time"] = parse_time(r["time"])
+    times, values = _sorted_readings(prs, end)  # võib olla ka enne starti
+    idx = _carry_forward_index(times, start, interval, count)
 
-    prs = [r for r in prs if r["time"] <= end]  # võib olla ka enne starti
-    prs.sort(key=lambda r: r["time"])
-    times = [r["time"] for r in prs]
+    # Slots are increasing, so a slot with no value at or before it is always the first one
+    if idx[0] < 0:
+        raise TaskFailException(f"No valid {label} value for time {start}")
 
-    result = []
-    current_idx = 0
+    return [
+        {"time": start + timedelta(seconds=i * interval), "value": values[j]}
+        for i, j in enumerate(idx.tolist())
+    ]
 
-    for i in range(count):
-        expected_time = start + timedelta(seconds=i * interval)
-        # Leia viimane väärtus, mille aeg ≤ expected_time
-        while current_idx + 1 < len(prs) and prs[current_idx + 1]["time"] <= expected_time:
-            current_idx += 1
+def _time_array(series) -> np.ndarray:
+    """Epoch-microsecond times of a readings list or TimeSeries, in input order."""
+    if isinstance(series, TimeSeries):
+        return series.epoch_us
+    return epoch_us_many([point["time"] for point in series])
 
-        if prs[current_idx]["time"] <= expected_time:
-            value = prs[current_idx]["value"]
-        else:
-            raise TaskFailException(f"No valid {label} value for time {expected_time}")
+def _float_arrays(series):
+    """Epoch-microsecond times and float64 values (None -> NaN), sorted by time."""
+    if isinstance(series, TimeSeries):
+        times, values = series.to_numpy()
+    else:
+        times = _time_array(series)
+        values = np.fromiter(
+            (np.nan if point.get("value") is None else point["value"] for point in series),
+            dtype=np.float64, count=len(series),
+        )
+    order = np.argsort(times, kind="stable")
+    return times[order], values[order]
+
+def _common_range_us(series_list) -> tuple:
+    """(max of starts, min of ends) in epoch microseconds; empty series are ignored."""
+    start_us, end_us, _, _ = _common_range(series_list)
+    return start_us, end_us
+
+def _common_range(series_list) -> tuple:
+    """_common_range_us plus the datetimes of those two readings, with their own offsets."""
+    bounds = []
+    for series in series_list:
+        times = _time_array(series)
+        if len(times):
+            bounds.append((series, times, int(times.argmin()), int(times.argmax())))
+    if not bounds:
+        raise ValueError("Kõik sisendseeriad on tühjad või puuduvad.")
+    start_series, start_times, start_i, _ = max(bounds, key=lambda b: b[1][b[2]])
+    end_series, end_times, _, end_i = min(bounds, key=lambda b: b[1][b[3]])
 
-        result.append({"time": expected_time, "value": value})
+    def as_datetime(series, times, i):
+        if isinstance(series, TimeSeries):
+            return from_epoch_us(times[i])
+        return parse_time(series[i]["time"])
 
-    return result
+    return (int(start_times[start_i]), int(end_times[end_i]),
+            as_datetime(start_series, start_times, start_i), as_datetime(end_series, end_times, end_i))
 
-def find_common_time_range(series_list: List[List[Dict[str, str]]]) -> Dict[str, str]:
+def find_common_time_range(series_list: List[Union[List[Dict[str, str]], TimeSeries]]) -> Dict[str, str]:
     """
     Leiab maksimaalse miinimumaja ja minimaalse maksimumaja aegridade loendist.
 
     Args:
         series_list: List massiive, kus iga massiiv on kujul [{"time": "...", "value": ...}, ...]
+                     või TimeSeries
 
     Returns:
         Dict, kus on 'start' ja 'end' ISO 8601 kuupäevadena.
     """
-    min_starts = []
-    max_ends = []
+    _, _, start, end = _common_range(series_list)
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat()
+    }
 
-    for series in series_list:
-        if not series:
-            continue  # ignoreeri tühje seeriaid
-        times = [datetime.fromisoformat(point["time"]) for point in series]
-        min_starts.append(min(times))
-        max_ends.append(max(times))
+FILL_POLICIES = ("ffill", "linear", "exact")
 
-    if not min_starts or not max_ends:
-        raise ValueError("Kõik sisendseeriad on tühjad või puuduvad.")
+def align_series(
+    series_dict: Dict[str, Union[List[Dict[str, Union[str, datetime, float]]], TimeSeries]],
+    interval: int,
+    fill_policy: str = "ffill",
+    start: Union[str, datetime, None] = None,
+    end: Union[str, datetime, None] = None,
+    as_dataframe: bool = False
+):
+    """
+    Resamples several series onto one shared time grid.
+
+    The grid runs from start to end (default: the common time range of all
+    series, as find_common_time_range) in steps of interval seconds. Each
+    series becomes one column of a (slots x series) float64 matrix:
 
-    max_of_mins = max(min_starts)
-    min_of_maxs = min(max_ends)
+        "ffill"   last value at or before the slot (as extract_prognosis_values)
+        "linear"  linear interpolation between the neighbouring non-missing readings
+        "exact"   only readings exactly on the slot
 
+    Slots without a value are NaN (e.g. before a series' first reading when
+    start is given explicitly).
+
+    Returns:
+        Dict with "start", "end" (datetimes), "times" (list of UTC datetimes),
+        "columns" (series_dict keys) and "values" (2-D numpy array); or, with
+        as_dataframe, a pandas DataFrame indexed by naive UTC times.
+    """
+    if fill_policy not in FILL_POLICIES:
+        raise ValueError(f"fill_policy must be one of {FILL_POLICIES}")
+    if interval <= 0:
+        raise ValueError("interval must be positive")
+    if not series_dict:
+        raise ValueError("series_dict is empty")
+
+    if start is None or end is None:
+        common_start, common_end = _common_range_us(series_dict.values())
+        start_us = common_start if start is None else epoch_us(start)
+        end_us = common_end if end is None else epoch_us(end)
+    else:
+        start_us, end_us = epoch_us(start), epoch_us(end)
+    if start_us > end_us:
+        raise ValueError("Aegridadel puudub ühine ajavahemik.")
+
+    step_us = round(interval * 1_000_000)
+    slots = start_us + np.arange((end_us - start_us) // step_us + 1, dtype=np.int64) * step_us
+    matrix = np.full((len(slots), len(series_dict)), np.nan)
+
+    for column, series in enumerate(series_dict.values()):
+        times, values = _float_arrays(series)
+        if not len(times):
+            continue
+        if fill_policy == "linear":
+            valid = ~np.isnan(values)
+            times, values = times[valid], values[valid]
+            if not len(times):
+                continue
+            inside = (slots >= times[0]) & (slots <= times[-1])
+            matrix[inside, column] = np.interp(slots[inside], times, values)
+            continue
+        idx = np.searchsorted(times, slots, side="right") - 1
+        found = idx >= 0
+        if fill_policy == "exact":
+            found &= times[np.maximum(idx, 0)] == slots
+        matrix[found, column] = values[idx[found]]
+
+    if as_dataframe:
+        import pandas as pd
+        index = pd.DatetimeIndex(slots.view("datetime64[us]"), copy=False)
+        return pd.DataFrame(matrix, index=index, columns=list(series_dict), copy=False)
     return {
-        "start": max_of_mins.isoformat(),
-        "end": min_of_maxs.isoformat()
+        "start": from_epoch_us(start_us),
+        "end": from_epoch_us(slots[-1]),
+        "times": from_epoch_us_many(slots),
+        "columns": list(series_dict),
+        "values": matrix,
     }
-    
-def extract_values_only(series: List[Dict[str, Union[datetime, float]]]) -> List[float]:
+
+def extract_values_only(series: Union[List[Dict[str, Union[datetime, float]]], TimeSeries]) -> List[float]:
+    if isinstance(series, TimeSeries):
+        return series.values.tolist()
     return [entry["value"] for entry in series]
 
+def diff_prognosis(
+    previous: List[Dict[str, Union[str, datetime, float]]],
+    new: List[Dict[str, Union[str, datetime, float]]],
+    tolerance: float = 0.0
+) -> Dict[str, object]:
+    """
+    Compares a new prognosis horizon with the previous prognosis readings.
+
+    A new reading is unchanged when the previous prognosis has a reading at the
+    same time whose value differs by at most tolerance (two missing values are
+    equal). Previous readings outside the new horizon are ignored.
+
+    Returns:
+        Dict with "changed" (number of new readings that differ from, or are
+        missing in, the previous prognosis), "overlap_changed" (how many of
+        those are not after the previous prognosis' last time) and "tail"
+        (the new readings after the previous prognosis' last time).
+    """
+    if not new:
+        return {"changed": 0, "overlap_changed": 0, "tail": []}
+    new_times = epoch_us_many([r["time"] for r in new])
+    new_values = np.array([np.nan if r.get("value") is None else r["value"] for r in new], dtype=np.float64)
+    if not previous:
+        return {"changed": len(new), "overlap_changed": 0, "tail": list(new)}
+
+    old_times, old_values = _float_arrays(previous)
+    idx = np.searchsorted(old_times, new_times)
+    found = idx < len(old_times)
+    found[found] = old_times[idx[found]] == new_times[found]
+    matched = np.full(len(new), np.nan)
+    matched[found] = old_values[idx[found]]
+    same = found & (
+        (np.abs(new_values - matched) <= tolerance) | (np.isnan(new_values) & np.isnan(matched))
+    )
+
+    in_tail = new_times > old_times[-1]
+    return {
+        "changed": int((~same).sum()),
+        "overlap_changed": int((~same & ~in_tail).sum()),
+        "tail": [new[i] for i in np.flatnonzero(in_tail).tolist()],
+    }
+
 def generate_prognosis_entries(
     count=135,
     start_time=datetime.now(timezone.utc),
@@ -171,15 +321,16 @@ def generate_prognosis_entries(
     
     prognosis_id = random.randint(1, 300_000)
 
-    entries = []
-    for i in range(count):
-        entry_time = start_time + timedelta(minutes=i * interval_minutes)
-        entry = {
+    start_us = epoch_us(start_time)
+    start_us -= start_us % 1_000_000  # whole seconds
+    times = format_epoch_us_many(start_us + np.arange(count, dtype=np.int64) * round(interval_minutes * 60_000_000))
+
+    return [
+        {
             'id': i + 1,
-            'time': entry_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'time': entry_time,
             'value': 0,
             'datapointPrognosisId': prognosis_id
         }
-        entries.append(entry)
-
-    return entries
+        for i, entry_time in enumerate(times)
+    ]
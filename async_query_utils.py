@@ -0,0 +1,189 @@
+# Async counterparts of the query_utils helpers.
+#
+# Uses the URL, headers and connection pool set up by query_utils.init(), so
+# call that (and add_header) first. Each helper is a coroutine; fire several
+# at once with asyncio.gather(), e.g.
+#
+#   prod, cons = await asyncio.gather(
+#       async_query_utils.get_readings("production_p_lt", start, end),
+#       async_query_utils.get_readings("consumption_p_lt", start, end))
+import asyncio
+import query_utils
+from AsyncQuery import AsyncQuery
+import Util
+from timestamps import format_times
+
+# Helper to create AsyncQuery object
+def Q():
+    return AsyncQuery(query_utils.Q())
+
+###########################################################
+# GET
+###########################################################
+
+# GET datapoint data; from the datapoint registry if query_utils has one
+async def get_datapoint(dp_identifier):
+    if query_utils._datapoint_registry is not None:
+        return await asyncio.to_thread(query_utils.get_datapoint, dp_identifier)
+    dp_data = await (
+        Q()
+        .filter(identifier__equals=dp_identifier)
+        .paginate(page=0, size=1)
+        .get("/datapoints")
+    )
+    query_utils._logger.debug("get_datapoint(%s) -> %s", dp_identifier, dp_data)
+    return dp_data
+
+# GET datapoint ID
+async def get_datapoint_ID(dp_identifier):
+    dp_data = await get_datapoint(dp_identifier)
+    return dp_data[0]["id"]
+
+async def _last_prognosis_id(dp_identifier):
+    if query_utils._datapoint_registry is not None:
+        return await asyncio.to_thread(query_utils._last_prognosis_id, dp_identifier)
+    return (await get_datapoint(dp_identifier))[0].get("lastPrognosisId")
+
+# Get datapoint last reading by identifier
+async def get_last_reading(dp_identifier):
+    dp_id = await get_datapoint_ID(dp_identifier)
+    last_reading = await (
+        Q()
+        .filter(datapointId__equals=dp_id)
+        .order_by("time", "desc")
+        .paginate(page=0, size=1)
+        .get("/readings")
+    )
+    return last_reading
+
+# Get datapoint last reading value by identifier
+async def get_last_reading_value(dp_identifier):
+    last_reading_value = await get_last_reading(dp_identifier)
+    return last_reading_value[0].get("value")
+
+# General-purpose readings fetch, see query_utils.get_readings for the
+# retrieval mode table.
+async def get_readings(dp_identifier, from_time=None, to_time=None,
+                       retrieval_mode=None, interval_seconds=None,
+                       rollover_value=None, edge_type=None,
+                       page=0, size=10000):
+    dp_id = await get_datapoint_ID(dp_identifier)
+    q = Q().filter(**query_utils.readings_filters(dp_id, from_time, to_time, retrieval_mode,
+                                                  interval_seconds, rollover_value, edge_type))
+    return await q.paginate(page=page, size=size).get("/readings") or []
+
+# Get datapoint last control command by identifier
+async def get_last_control(dp_identifier):
+    dp_id = await get_datapoint_ID(dp_identifier)
+    last_control_val = await (
+        Q()
+        .filter(datapointId__equals=dp_id)
+        .order_by("time", "desc")
+        .paginate(page=0, size=1)
+        .get("/control-values")
+    )
+    return last_control_val
+
+# Get datapoint last control command value by identifier
+async def get_last_control_value(dp_identifier):
+    last_control_value = await get_last_control(dp_identifier)
+    return last_control_value[0].get("value")
+
+# Get datapoint last control command status by identifier
+async def get_last_control_status(dp_identifier):
+    last_control_value = await get_last_control(dp_identifier)
+    return last_control_value[0].get("sent")
+
+# Get datapoint last control command value and status by identifier
+async def get_last_control_value_and_status(dp_identifier):
+    last_control_value = await get_last_control(dp_identifier)
+    return {
+        "value" : last_control_value[0].get("value"),
+        "sent" : last_control_value[0].get("sent")}
+
+# GET datapoint last prognosis readings data
+async def get_last_prognosis_readings(dp_identifier, generate_if_missing=False):
+    last_prognosis_id = await _last_prognosis_id(dp_identifier)
+    if last_prognosis_id is not None:
+        last_prognosis_readings = await (
+            Q()
+            .filter(datapointPrognosisId__equals=last_prognosis_id)
+            .get("/prognosis-readings")
+        )
+        if not last_prognosis_readings:
+            raise RuntimeError(f"No prognosis readings found for lastPrognosisId={last_prognosis_id}")
+    else:
+        query_utils._logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
+        if generate_if_missing:
+            last_prognosis_readings = Util.generate_prognosis_entries()
+        else:
+            last_prognosis_readings = []
+
+    return last_prognosis_readings
+
+# GET datapoint's last datapoint prognosis
+async def get_datapoint_prognosis(dp_identifier):
+    last_prognosis_id = await _last_prognosis_id(dp_identifier)
+    query_utils._logger.debug("lastPrognosisId = %s", last_prognosis_id)
+    if last_prognosis_id is not None:
+        datapoint_prognosis = await (
+            Q()
+            .filter(Id__equals=last_prognosis_id)
+            .get("/datapoint-prognoses")
+        )
+        query_utils._logger.debug(f"datapoint_prognosis: {datapoint_prognosis}")
+        return datapoint_prognosis
+    else:
+        query_utils._logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
+        return None
+
+##########################################################
+# POST
+##########################################################
+
+# POST prognosis readings with at most max_in_flight requests open.
+# Returns one response per reading in payload order, None where it failed.
+async def post_prognosis_readings(prognosis_readings_payload, max_in_flight=8):
+    prognosis_readings_payload = format_times(prognosis_readings_payload)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def post_reading(reading):
+        async with semaphore:
+            return await Q().post("/prognosis-readings", json=reading)
+
+    responses = await asyncio.gather(*(post_reading(r) for r in prognosis_readings_payload))
+    failed = sum(1 for r in responses if r is None)
+    if failed:
+        query_utils._logger.error("post_prognosis_readings: %d of %d readings failed to upload",
+                                  failed, len(responses))
+    return responses
+
+# POST datapoint prognosis
+# Returns the created prognosis with "readings" set to the per-reading upload
+# results (see post_prognosis_readings), or None if it could not be created.
+async def post_datapoint_prognosis(prognosis_payload):
+    prognosis_payload = {**prognosis_payload, "readings": format_times(prognosis_payload["readings"])}
+    response = await Q().post("/datapoint-prognoses", json=prognosis_payload)
+    if response is None:
+        return None
+
+    prognosis_readings_payload = prognosis_payload["readings"]
+    for dp_pr_id in prognosis_readings_payload:
+        dp_pr_id["datapointPrognosisId"] = response["id"]
+    reading_results = await post_prognosis_readings(prognosis_readings_payload)
+    if query_utils._datapoint_registry is not None:
+        query_utils._datapoint_registry.set_last_prognosis_id(prognosis_payload.get("datapointId"), response["id"])
+
+    return {**response, "readings": reading_results}
+
+# POST datapoint reading
+async def post_datapoint_reading(datapoint_reading_payload):
+    return await Q().post("/readings", json=format_times([datapoint_reading_payload])[0])
+
+# POST datapoint control value
+async def post_datapoint_ctrl_value(datapoint_ctrl_val_payload):
+    return await Q().post("/control-values", json=datapoint_ctrl_val_payload)
+
+# POST set datapoint control value status to sent
+async def post_datapoint_ctrl_status_sent(ctrl_status_sent_payload):
+    return await Q().post("/control-values/set-sent", json=ctrl_status_sent_payload)
@@ -0,0 +1,253 @@
+# mock_api.py
+#
+# Local stand-in for the DSxOS API used by the benchmarks.
+#
+# Implements /auth/token, /datapoints, /readings (pagination, sort, time
+# filters and retrieval modes), /control-values, /datapoint-prognoses,
+# /prognosis-readings and a Loki push endpoint. Readings are generated on
+# the fly: datapoint N has `readings` points every `step` seconds from
+# BASE_TIME, so any volume can be served without holding it in memory.
+#
+# Run standalone:  python benchmarks/mock_api.py --port 8080 --latency 20
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import retrieval_modes
+from TimeSeries import TimeSeries
+from timestamps import epoch_us, format_epoch_us
+
+BASE_TIME = "2026-01-01T00:00:00Z"
+
+class MockConfig:
+    """latency / jitter in seconds per request; readings and step describe each datapoint's series."""
+    def __init__(self, latency=0.0, jitter=0.0, datapoints=50, readings=100_000, step=60):
+        self.latency = latency
+        self.jitter = jitter
+        self.datapoints = datapoints
+        self.readings = readings
+        self.step = step
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.base_us = epoch_us(BASE_TIME)
+        self.lock = threading.Lock()
+        self.prognoses = {}           # id -> datapoint prognosis
+        self.prognosis_readings = {}  # datapointPrognosisId -> [readings]
+        self.control_values = []
+        self.posted_readings = []
+        self.loki_lines = 0
+        self.next_id = 1
+        self.datapoints = [
+            {"id": i, "identifier": f"dp{i}", "name": f"Datapoint {i}", "lastPrognosisId": None}
+            for i in range(1, config.datapoints + 1)
+        ]
+        # Every datapoint starts with a 135-entry prognosis
+        for dp in self.datapoints:
+            prognosis = self._add_prognosis({"datapointId": dp["id"]})
+            self._add_prognosis_readings([
+                {"time": format_epoch_us(self.base_us + k * 900_000_000), "value": float(k),
+                 "datapointPrognosisId": prognosis["id"]}
+                for k in range(135)
+            ])
+
+    def new_id(self):
+        with self.lock:
+            value = self.next_id
+            self.next_id += 1
+            return value
+
+    def _add_prognosis(self, payload):
+        prognosis = {key: value for key, value in payload.items() if key != "readings"}
+        prognosis["id"] = self.new_id()
+        self.prognoses[prognosis["id"]] = prognosis
+        for dp in self.datapoints:
+            if dp["id"] == prognosis.get("datapointId"):
+                dp["lastPrognosisId"] = prognosis["id"]
+        return prognosis
+
+    def _add_prognosis_readings(self, readings):
+        stored = []
+        for reading in readings:
+            reading = dict(reading, id=self.new_id())
+            self.prognosis_readings.setdefault(reading.get("datapointPrognosisId"), []).append(reading)
+            stored.append(reading)
+        return stored
+
+    def reading(self, dp_id, k):
+        return {
+            "id": dp_id * 10_000_000 + k,
+            "time": format_epoch_us(self.base_us + k * self.config.step * 1_000_000),
+            "value": round(1000 * math.sin(k / 50 + dp_id), 3),
+            "datapointId": dp_id,
+        }
+
+    def reading_range(self, q):
+        # Index range [lo, hi) of generated readings matching the time filters
+        step_us = self.config.step * 1_000_000
+        lo, hi = 0, self.config.readings
+        if "time.greaterThanOrEqual" in q:
+            lo = max(lo, -(-(epoch_us(q["time.greaterThanOrEqual"]) - self.base_us) // step_us))
+        if "time.lessThan" in q:
+            hi = min(hi, -(-(epoch_us(q["time.lessThan"]) - self.base_us) // step_us))
+        return lo, max(lo, hi)
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _delay(self):
+            config = state.config
+            if config.latency or config.jitter:
+                time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+
+        def _send(self, obj, status=200, etag=False):
+            body = b"" if obj is None else json.dumps(obj).encode("utf-8")
+            if etag:
+                tag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == tag:
+                    body, status = b"", 304
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", tag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            data = self.rfile.read(length) if length else b""
+            if self.headers.get("Content-Encoding") == "gzip":
+                data = gzip.decompress(data)
+            return data
+
+        def do_GET(self):
+            self._delay()
+            url = urllib.parse.urlparse(self.path)
+            q = dict(urllib.parse.parse_qsl(url.query))
+            page, size = int(q.get("page", 0)), int(q.get("size", 20))
+            path = url.path[url.path.find("/", 1):] if url.path.startswith("/api") else url.path
+
+            if path == "/datapoints":
+                items = state.datapoints
+                if "identifier.equals" in q:
+                    items = [d for d in items if d["identifier"] == q["identifier.equals"]]
+                if "identifier.in" in q:
+                    wanted = set(q["identifier.in"].split(","))
+                    items = [d for d in items if d["identifier"] in wanted]
+                if "id.in" in q:
+                    wanted = set(q["id.in"].split(","))
+                    items = [d for d in items if str(d["id"]) in wanted]
+                return self._send(items[page * size:(page + 1) * size], etag=True)
+
+            if path in ("/readings", "/control-values"):
+                return self._send(self._readings(q, page, size))
+
+            if path == "/datapoint-prognoses":
+                wanted = q.get("Id.equals") or q.get("id.equals")
+                items = [p for p in state.prognoses.values() if wanted is None or str(p["id"]) == wanted]
+                return self._send(items[page * size:(page + 1) * size], etag=True)
+
+            if path == "/prognosis-readings":
+                ids = q.get("datapointPrognosisId.in") or q.get("datapointPrognosisId.equals") or ""
+                items = [r for p in ids.split(",") if p for r in state.prognosis_readings.get(int(p), [])]
+                return self._send(items[page * size:(page + 1) * size])
+
+            self._send({"error": "not found"}, 404)
+
+        def _readings(self, q, page, size):
+            dp_id = int(q.get("datapointId.equals", 1))
+            lo, hi = state.reading_range(q)
+            mode = q.get("retrievalMode")
+            if mode not in (None, "FULL"):
+                series = TimeSeries.from_readings([state.reading(dp_id, k) for k in range(lo, hi)], dp_id)
+                from_us = epoch_us(q["time.greaterThanOrEqual"]) if "time.greaterThanOrEqual" in q else state.base_us
+                to_us = epoch_us(q["time.lessThan"]) if "time.lessThan" in q else (
+                    state.base_us + state.config.readings * state.config.step * 1_000_000)
+                result = retrieval_modes.compute(
+                    series, mode, from_us, to_us,
+                    float(q["intervalSeconds"]) if "intervalSeconds" in q else None,
+                    float(q["rolloverValue"]) if "rolloverValue" in q else None,
+                    q.get("edgeType"),
+                ).to_readings()
+                return result[page * size:(page + 1) * size]
+            indices = range(lo, hi)
+            if q.get("sort", "").endswith(",desc"):
+                indices = indices[::-1]
+            return [state.reading(dp_id, k) for k in indices[page * size:(page + 1) * size]]
+
+        def do_POST(self):
+            self._delay()
+            path = urllib.parse.urlparse(self.path).path
+            path = path[path.find("/", 1):] if path.startswith("/api") else path
+            data = self._body()
+
+            if path == "/auth/token":
+                return self._send({"access_token": "mock-token", "token_type": "Bearer", "expires_in": 3600})
+            if path.endswith("/loki/api/v1/push"):
+                payload = json.loads(data)
+                with state.lock:
+                    state.loki_lines += sum(len(s["values"]) for s in payload["streams"])
+                return self._send(None, 204)
+
+            payload = json.loads(data) if data else None
+            if path == "/datapoint-prognoses":
+                return self._send(state._add_prognosis(payload), 201)
+            if path == "/prognosis-readings":
+                readings = payload if isinstance(payload, list) else [payload]
+                stored = state._add_prognosis_readings(readings)
+                return self._send(stored if isinstance(payload, list) else stored[0], 201)
+            if path == "/readings":
+                state.posted_readings.append(payload)
+                return self._send(dict(payload, id=state.new_id()), 201)
+            if path == "/control-values":
+                state.control_values.append(payload)
+                return self._send(dict(payload, id=state.new_id()), 201)
+            if path == "/control-values/set-sent":
+                return self._send(payload)
+            self._send({"error": "not found"}, 404)
+
+    return Handler
+
+def start(config=None, host="127.0.0.1", port=0):
+    """Start the mock API in a background thread; returns (server, state). Base URL: http://host:port/api"""
+    state = MockState(config or MockConfig())
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-api", daemon=True).start()
+    return server, state
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock DSxOS API")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Per-request latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter (+/-) in ms")
+    parser.add_argument("--datapoints", type=int, default=50)
+    parser.add_argument("--readings", type=int, default=100_000, help="Readings per datapoint")
+    parser.add_argument("--step", type=int, default=60, help="Seconds between readings")
+    args = parser.parse_args()
+    server, _ = start(MockConfig(args.latency / 1000, args.jitter / 1000, args.datapoints, args.readings, args.step),
+                      port=args.port)
+    print(f"Mock DSxOS API on http://127.0.0.1:{server.server_port}/api")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,205 @@
+# run_benchmarks.py
+#
+# Throughput / latency benchmarks for query_utils, Util resampling and
+# LokiHandler against the local mock API (benchmarks/mock_api.py, started in
+# a child process so it does not share the GIL with the client).
+#
+# Every run is appended to benchmarks/results.jsonl together with the git
+# version, and compared with the previous run (or --baseline VERSION):
+#
+#   python benchmarks/run_benchmarks.py
+#   python benchmarks/run_benchmarks.py --latency 20 --only readings
+#   python benchmarks/run_benchmarks.py --baseline v1.2.0 --fail-on-regression
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+import mock_api
+import query_utils
+import Util
+from logger import LokiHandler
+
+RESULTS_FILE = os.path.join(HERE, "results.jsonl")
+
+def _serve(config, conn):
+    server, _ = mock_api.start(config)
+    conn.send(server.server_port)
+    threading.Event().wait()
+
+def start_mock(config):
+    parent, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(config, child), daemon=True)
+    process.start()
+    return process, parent.recv()
+
+def measure(fn, repeat, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return {
+        "runs": repeat,
+        "mean_s": statistics.fmean(times),
+        "p50_s": times[len(times) // 2],
+        "p95_s": times[min(len(times) - 1, int(len(times) * 0.95))],
+        "min_s": times[0],
+    }
+
+def scenarios(args, base_url, loki_url):
+    dps = [f"dp{i}" for i in range(1, 21)]
+    day_start = "2026-01-01T00:00:00Z"
+    day_end = "2026-01-02T00:00:00Z"
+    week_end = "2026-01-08T00:00:00Z"
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    minute_series = [
+        {"time": (t0 + timedelta(minutes=k)).isoformat(), "value": float(k % 97)}
+        for k in range(args.resample_points)
+    ]
+    resample_end = t0 + timedelta(minutes=args.resample_points - 1)
+    prognosis = Util.generate_prognosis_entries(start_time=t0)
+
+    # (group, name, callable, items processed per call)
+    yield "query", "get_last_reading_value", lambda: query_utils.get_last_reading_value("dp1"), 1
+    yield "readings", "get_readings_full_1d", lambda: query_utils.get_readings_full("dp1", day_start, day_end), 1440
+    yield "readings", "get_readings_full_1d_series", (
+        lambda: query_utils.get_readings_full("dp1", day_start, day_end, as_series=True)), 1440
+    yield "readings", "get_readings_average_1w", (
+        lambda: query_utils.get_readings_average("dp1", day_start, week_end, 900)), 672
+    yield "readings", "iter_readings_1w", (
+        lambda: sum(1 for _ in query_utils.iter_readings("dp1", day_start, week_end, page_size=2000))), 10080
+    yield "readings", "get_readings_many_20x1d", (
+        lambda: query_utils.get_readings_many(dps, day_start, day_end)), 20 * 1440
+    yield "query", "get_snapshot_20", lambda: query_utils.get_snapshot(dps), 20
+    yield "write", "post_datapoint_prognosis_135", (
+        lambda: query_utils.post_datapoint_prognosis(
+            {"datapointId": 1, "readings": [dict(r) for r in prognosis]})), 135
+    yield "util", "generate_result_series", (
+        lambda: Util.generate_result_series(minute_series, t0, resample_end, 60, 0.0)), args.resample_points
+    yield "util", "extract_prognosis_values_15min", (
+        lambda: Util.extract_prognosis_values(minute_series, "bench", t0, resample_end, 900)), args.resample_points
+    yield "util", "find_common_time_range", (
+        lambda: Util.find_common_time_range([minute_series, minute_series[10:]])), 2 * args.resample_points
+
+    handler = LokiHandler(loki_url, tags={"app_name": "bench"}, flush_interval=0.2,
+                          queue_size=args.log_records * (args.repeat + 2))
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    records = [logging.LogRecord("bench", logging.INFO, __file__, 0, "log line %d", (i,), None)
+               for i in range(args.log_records)]
+
+    def emit_all():
+        for record in records:
+            handler.emit(record)
+
+    def emit_and_ship():
+        emit_all()
+        handler.flush()
+
+    yield "loki", "loki_emit", emit_all, args.log_records
+    yield "loki", "loki_emit_and_ship", emit_and_ship, args.log_records
+
+def git_version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty", "--tags"], cwd=HERE, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_history():
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(results, baseline, threshold):
+    # Returns names of benchmarks whose p50 got slower by more than threshold percent
+    previous = {r["name"]: r for r in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline['version']} ({baseline['timestamp']}):")
+    for r in results:
+        old = previous.get(r["name"])
+        if old is None:
+            continue
+        change = (r["p50_s"] - old["p50_s"]) / old["p50_s"] * 100 if old["p50_s"] else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(r["name"])
+        print(f"  {r['name']:<34} {old['p50_s'] * 1000:10.2f} ms -> {r['p50_s'] * 1000:10.2f} ms {change:+7.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query_utils, Util and LokiHandler against a mock API")
+    parser.add_argument("--latency", type=float, default=5.0, help="Mock API latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=1.0, help="Mock API latency jitter in ms")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--resample-points", type=int, default=7 * 24 * 60, help="Readings in Util benchmarks")
+    parser.add_argument("--log-records", type=int, default=10_000, help="Records in LokiHandler benchmarks")
+    parser.add_argument("--only", help="Run only benchmarks whose group or name contains this text")
+    parser.add_argument("--baseline", help="Version in results.jsonl to compare with (default: previous run)")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent (p50)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to results.jsonl")
+    args = parser.parse_args()
+
+    config = mock_api.MockConfig(latency=args.latency / 1000, jitter=args.jitter / 1000)
+    process, port = start_mock(config)
+    base_url = f"http://127.0.0.1:{port}/api"
+    query_utils.init(base_url, {}, logger=logging.getLogger("bench"))
+    logging.getLogger("bench").setLevel(logging.WARNING)
+
+    results = []
+    try:
+        for group, name, fn, items in scenarios(args, base_url, f"http://127.0.0.1:{port}/loki/api/v1/push"):
+            if args.only and args.only not in group and args.only not in name:
+                continue
+            result = dict(group=group, name=name, items=items, **measure(fn, args.repeat))
+            result["items_per_s"] = items / result["p50_s"] if result["p50_s"] else None
+            results.append(result)
+            print(f"{group:<9} {name:<34} p50 {result['p50_s'] * 1000:10.2f} ms  "
+                  f"p95 {result['p95_s'] * 1000:10.2f} ms  {result['items_per_s'] or 0:14.0f} items/s")
+    finally:
+        process.terminate()
+
+    history = load_history()
+    run = {
+        "version": git_version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": results,
+    }
+    baseline = None
+    if args.baseline:
+        baseline = next((h for h in reversed(history) if h["version"] == args.baseline), None)
+        if baseline is None:
+            print(f"Baseline {args.baseline} not found in {RESULTS_FILE}")
+    elif history:
+        baseline = history[-1]
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+
+    if not args.no_save:
+        with open(RESULTS_FILE, "a") as f:
+            f.write(json.dumps(run) + "\n")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
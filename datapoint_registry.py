@@ -0,0 +1,134 @@
+# datapoint_registry.py
+
+import logging
+import threading
+import time
+
+class DatapointRegistry:
+    """In-memory datapoint metadata indexed by identifier, id and lastPrognosisId.
+
+    load() fetches either all datapoints in one paginated /datapoints sweep,
+    or only the configured identifiers with identifier.in queries. Lookups
+    are then answered from memory. An entry older than max_age seconds is
+    re-fetched on its next lookup, together with every other stale or unknown
+    identifier asked for in the same call, so a refresh only touches the
+    datapoints actually in use. Identifiers the API does not know are
+    remembered for max_age as well. lastPrognosisId changes whenever a new
+    prognosis is posted: set_last_prognosis_id() records our own posts, and
+    callers needing other apps' prognoses pass a shorter max_age.
+
+    fetch(filters, page, size) must return a list of datapoint dicts, or None
+    on failure (stale entries are then kept).
+    """
+    def __init__(self, fetch, identifiers=None, page_size=1000, max_age=300, logger=None):
+        self.fetch = fetch
+        self.identifiers = list(identifiers) if identifiers is not None else None
+        self.page_size = page_size
+        self.max_age = max_age
+        self.logger = logger or logging.getLogger(__name__)
+        self._by_identifier = {}
+        self._by_id = {}
+        self._by_prognosis_id = {}
+        self._loaded_at = {}   # identifier -> time.monotonic() of the last fetch
+        self._missing = {}     # identifier -> time.monotonic() the API last did not know it
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._by_identifier)
+
+    def __contains__(self, identifier):
+        return identifier in self._by_identifier
+
+    def load(self):
+        if self.identifiers is not None:
+            self.refresh(self.identifiers)
+            return
+        page = 0
+        while True:
+            batch = self.fetch({}, page, self.page_size)
+            if batch is None:
+                self.logger.error("DatapointRegistry: loading /datapoints page %d failed", page)
+                return
+            self._add(batch)
+            if len(batch) < self.page_size:
+                break
+            page += 1
+        self.logger.debug("DatapointRegistry: loaded %d datapoints", len(self._by_identifier))
+
+    # Re-fetch identifiers (default: all known ones) with identifier.in queries
+    def refresh(self, identifiers=None):
+        with self._lock:
+            identifiers = list(self._by_identifier) if identifiers is None else list(dict.fromkeys(identifiers))
+        chunk_size = min(self.page_size, 100)  # keep the query string short
+        for i in range(0, len(identifiers), chunk_size):
+            chunk = identifiers[i:i + chunk_size]
+            batch = self.fetch({"identifier__in": ",".join(chunk)}, 0, len(chunk))
+            if batch is None:
+                self.logger.warning("DatapointRegistry: refreshing %d datapoints failed, keeping old data", len(chunk))
+                continue
+            self._add(batch)
+            found = {dp.get("identifier") for dp in batch}
+            now = time.monotonic()
+            with self._lock:
+                for identifier in chunk:
+                    if identifier not in found:
+                        self._missing[identifier] = now
+                        self._remove(identifier)
+
+    # Datapoint dict for identifier, or None if the API does not know it
+    def get(self, identifier, max_age=None):
+        return self.get_many([identifier], max_age).get(identifier)
+
+    # {identifier: datapoint}; unknown identifiers are left out
+    def get_many(self, identifiers, max_age=None):
+        max_age = self.max_age if max_age is None else max_age
+        identifiers = list(dict.fromkeys(identifiers))
+        now = time.monotonic()
+        with self._lock:
+            stale = [
+                i for i in identifiers
+                if now - self._loaded_at.get(i, self._missing.get(i, -float("inf"))) >= max_age
+            ]
+        if stale:
+            self.refresh(stale)
+        with self._lock:
+            return {i: self._by_identifier[i] for i in identifiers if i in self._by_identifier}
+
+    def by_id(self, dp_id):
+        with self._lock:
+            return self._by_id.get(dp_id)
+
+    def by_prognosis_id(self, prognosis_id):
+        with self._lock:
+            return self._by_prognosis_id.get(prognosis_id)
+
+    # Record a prognosis we posted, without refetching the datapoint
+    def set_last_prognosis_id(self, dp_id, prognosis_id):
+        with self._lock:
+            dp = self._by_id.get(dp_id)
+            if dp is None:
+                return
+            self._by_prognosis_id.pop(dp.get("lastPrognosisId"), None)
+            dp["lastPrognosisId"] = prognosis_id
+            self._by_prognosis_id[prognosis_id] = dp
+
+    def _add(self, datapoints):
+        now = time.monotonic()
+        with self._lock:
+            for dp in datapoints:
+                identifier = dp.get("identifier")
+                self._remove(identifier)
+                self._by_identifier[identifier] = dp
+                self._by_id[dp.get("id")] = dp
+                if dp.get("lastPrognosisId") is not None:
+                    self._by_prognosis_id[dp["lastPrognosisId"]] = dp
+                self._loaded_at[identifier] = now
+                self._missing.pop(identifier, None)
+
+    def _remove(self, identifier):
+        old = self._by_identifier.pop(identifier, None)
+        self._loaded_at.pop(identifier, None)
+        if old is not None:
+            self._by_id.pop(old.get("id"), None)
+            if self._by_prognosis_id.get(old.get("lastPrognosisId")) is old:
+                del self._by_prognosis_id[old["lastPrognosisId"]]
@@ -0,0 +1,28 @@
+# jsonio.py
+#
+# JSON decoding helpers. Uses orjson when it is installed (several times
+# faster than the standard library on large /readings pages) and falls back
+# to the json module otherwise. ijson, when installed, enables incremental
+# parsing of response streams (see TimeSeries.from_json).
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Exceptions raised for a body that is not valid JSON (orjson's and json's
+# JSONDecodeError are ValueErrors; ijson has its own JSONError)
+DECODE_ERRORS = (ValueError,) if ijson is None else (ValueError, ijson.JSONError)
+
+# bytes or str -> Python objects
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,6 +1,10 @@
 # logger.py
 
+import atexit
+import gzip
 import logging
+import queue
+import threading
 import requests
 import json
 import time
@@ -32,38 +36,120 @@ def normalize_log_level(raw_level):
     return logging.INFO
 
 class LokiHandler(logging.Handler):
-    def __init__(self, url, tags=None, level=logging.NOTSET):
+    """Ships log records to Loki from a background thread.
+
+    emit() only formats the record and puts it on a bounded queue, so logging
+    never waits on the network. The shipper thread pushes queued records as one
+    batch per flush_interval seconds, or earlier once batch_size records are
+    waiting. When the queue is full, records go to spill_handler if one is set
+    (e.g. a FileHandler), otherwise they are dropped and counted in
+    self.dropped. Remaining records are pushed on close() and at exit.
+    """
+    def __init__(self, url, tags=None, level=logging.NOTSET, batch_size=500,
+                 flush_interval=1.0, queue_size=10000, compress=False, timeout=5,
+                 spill_handler=None):
         super().__init__(level)
         self.url = url
         self.tags = tags or {}
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compress = compress
+        self.timeout = timeout
+        self.spill_handler = spill_handler
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.session = requests.Session()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="LokiHandler", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
 
     def emit(self, record):
         try:
-            log_entry = self.format(record)
-            ts = str(int(time.time() * 1e9))  # nanoseconds timestamp
-            payload = {
-                "streams": [
-                    {
-                        "stream": self.tags,
-                        "values": [[ts, log_entry]],
-                    }
-                ]
-            }
-            response = requests.post(
-                self.url,
-                data=json.dumps(payload),
-                headers={"Content-Type": "application/json"},
-                timeout=5,
-            )
-            response.raise_for_status()
-        except Exception as e:
-            print(f"[LokiHandler] Failed to send log to Loki: {e}")
-
-def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki_url=None, loki_tags=None, level=logging.INFO):
+            ts = str(int(record.created * 1e9))  # nanoseconds timestamp
+            self.queue.put_nowait([ts, self.format(record)])
+        except queue.Full:
+            if self.spill_handler is not None:
+                self.spill_handler.handle(record)
+            else:
+                self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def flush(self, timeout=None):
+        # Wait until the shipper has pushed everything queued so far
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        while self.queue.unfinished_tasks and self._thread.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        if not self._stopped.is_set():
+            self._stopped.set()
+            atexit.unregister(self.close)  # don't keep a closed handler alive until exit
+            self._thread.join(self.flush_interval + self.timeout)
+            self.session.close()
+            if self.spill_handler is not None:
+                self.spill_handler.close()
+            if self.dropped:
+                print(f"[LokiHandler] Dropped {self.dropped} log records, queue was full")
+        super().close()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._push(batch)
+                except Exception as e:
+                    print(f"[LokiHandler] Failed to send {len(batch)} logs to Loki: {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+            elif self._stopped.is_set():
+                return
+
+    def _next_batch(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._stopped.is_set():
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _push(self, values):
+        payload = {
+            "streams": [
+                {
+                    "stream": self.tags,
+                    "values": values,
+                }
+            ]
+        }
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        response = self.session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+        response.raise_for_status()
+
+# loki_options are passed to LokiHandler (batch_size, flush_interval,
+# queue_size, compress, timeout). Records that do not fit in the Loki queue
+# are written to loki_spill_file if given, otherwise dropped.
+def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki_url=None, loki_tags=None, level=logging.INFO,
+                 loki_spill_file=None, **loki_options):
     log_level = normalize_log_level(level)
     
     logger = logging.getLogger(app_name)
     logger.setLevel(log_level)
+    for handler in logger.handlers:
+        handler.close()  # Stops the Loki shipper thread and flushes files
     logger.handlers = []  # Clear existing handlers if rerun
 
     # File Handler
@@ -80,7 +166,11 @@ def setup_logger(app_name="DSxOS_python_application", log_file="query.log", loki
 
     # Loki Handler (optional)
     if loki_url:
-        loki_handler = LokiHandler(url=loki_url, tags=loki_tags)
+        spill_handler = None
+        if loki_spill_file:
+            spill_handler = logging.FileHandler(loki_spill_file)
+            spill_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        loki_handler = LokiHandler(url=loki_url, tags=loki_tags, spill_handler=spill_handler, **loki_options)
         loki_handler.setLevel(log_level)
         loki_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
         logger.addHandler(loki_handler)
@@ -1,59 +1,122 @@
 import query_utils
 import argparse
+import signal
+import threading
 import yaml
 from datetime import datetime, timezone
 import pytz
 from logger import setup_logger
+import scheduler
+import profiling
 
-#######################################################################
-#### INITIALIZATION
-#######################################################################
 APP_NAME = "dsxos-app-test"
-
-# Create parser
-parser = argparse.ArgumentParser(description=f"Run {APP_NAME} with config file")
-parser.add_argument("-c", "--config", required=False, help="Path to config YAML file", default="/app/config.yaml")
-args = parser.parse_args()
-with open(args.config, "r") as f: 
-    raw_data = yaml.safe_load(f)
-    
-# Extract API URL and Token
-api_url = raw_data["params"]["apiEndpoint"]
-api_token = raw_data["params"]["token"]
-client_id = raw_data["params"]["clientId"]
-
-#api_headers = {"Authorization": "Bearer " + token}
-api_headers = {}
-
-app_name = raw_data["appModule"]
-
-# Initialize query_utils with URL + headers
-query_utils.init(api_url, api_headers)
-jwt_token = query_utils.get_token(client_id, api_token)
-query_utils.add_header("Authorization", f"Bearer {jwt_token}")
-
-# Initialize logger with central logging to Loki
-logger = setup_logger(
-    log_file="query.log",
-    loki_url="http://localhost:3100/loki/api/v1/push",  # Loki address
-    loki_tags={"app_name": APP_NAME},        # add more tags if needed
-    level=raw_data["logLevel"]    
-)
-
-# Log passed arguments for debugding
-logger.debug(f"{APP_NAME} run with arguments: %s", raw_data)
+LOG_FILE = "query.log"
 
 #######################################################################
 #### APPLICATION
 #######################################################################
-try:
-    # Your application logger with exception handling
-    
-except Exception as e:
-    # Exception handling
-    # logger.error(f'Error generating ESS schedule: {e}')
+def run_application(raw_data, logger):
+    try:
+        # Your application logic with exception handling
+        pass
+    except Exception as e:
+        # Exception handling
+        # logger.error(f'Error generating ESS schedule: {e}')
+        raise
+
+def run_once(raw_data, logger, profile=False, log_file=LOG_FILE, metrics_path=None):
+    if profile:
+        # Trace (chrome://tracing, ui.perfetto.dev) and cProfile stats of this run
+        # in profileDir, or next to the log file
+        prefix = profiling.run_prefix(log_file, raw_data.get("profileDir"))
+        with profiling.Profiler(prefix):
+            run_application(raw_data, logger)
+        logger.info(f"Profile written to {prefix}.trace.json and {prefix}.prof")
+    else:
+        run_application(raw_data, logger)
+
+    # Queued (write-behind) readings and control values must be out before the run ends
+    failed_writes = query_utils.flush_writes(timeout=60)
+    if failed_writes:
+        logger.error(f"{len(failed_writes)} queued writes failed")
+
+    #######################################################################
+    #### FINALIZATION
+    #######################################################################
+    # Request metrics of this run, Prometheus text format
+    query_utils.write_metrics(metrics_path or raw_data.get("metricsFile", "metrics.prom"))
+    logger.info(f"{APP_NAME} executed successfully")
 
 #######################################################################
-#### FINALIZATION
+#### INITIALIZATION
 #######################################################################
-logger.info(f"{APP_NAME} executed successfully")
+# Set up logging and query_utils for one config. Also used by multi_site.py,
+# which passes its own log file, logger name, Loki tags and shared
+# connection pool / caches (init_options go to query_utils.init).
+def setup_site(raw_data, log_file=LOG_FILE, logger_name="DSxOS_python_application", loki_tags=None,
+               auto_refresh=False, **init_options):
+    # Extract API URL and Token
+    api_url = raw_data["params"]["apiEndpoint"]
+    api_token = raw_data["params"]["token"]
+    client_id = raw_data["params"]["clientId"]
+
+    #api_headers = {"Authorization": "Bearer " + token}
+    api_headers = {}
+
+    app_name = raw_data["appModule"]
+
+    # Initialize logger with central logging to Loki
+    logger = setup_logger(
+        app_name=logger_name,
+        log_file=log_file,
+        loki_url="http://localhost:3100/loki/api/v1/push",  # Loki address
+        loki_tags={"app_name": APP_NAME, **(loki_tags or {})},  # add more tags if needed
+        level=raw_data["logLevel"]
+    )
+
+    # Initialize query_utils with URL + headers
+    query_utils.init(api_url, api_headers, logger=logger, **init_options)
+    # Reuses the access token cached by previous runs (in stateDir) until shortly before it expires
+    query_utils.enable_token_manager(client_id, api_token, auto_refresh=auto_refresh,
+                                     state_dir=raw_data.get("stateDir"))
+    # Datapoint metadata of the configured *_DP_ID datapoints is loaded once;
+    # identifier lookups of all query_utils helpers are then answered from memory
+    dp_identifiers = [v for k, v in raw_data["params"].items() if k.endswith("_DP_ID")]
+    query_utils.enable_datapoint_registry(identifiers=dp_identifiers or None)
+
+    # Log passed arguments for debugding
+    logger.debug(f"{APP_NAME} run with arguments: %s", raw_data)
+    return logger
+
+def main():
+    # Create parser
+    parser = argparse.ArgumentParser(description=f"Run {APP_NAME} with config file")
+    parser.add_argument("-c", "--config", required=False, help="Path to config YAML file", default="/app/config.yaml")
+    parser.add_argument("--daemon", action="store_true", help="Stay running and execute on the config's cron schedule")
+    parser.add_argument("--profile", action="store_true", help="Write a trace and cProfile stats of each run next to the log file")
+    args = parser.parse_args()
+    with open(args.config, "r") as f:
+        raw_data = yaml.safe_load(f)
+    daemon = args.daemon or bool(raw_data.get("daemon", False))
+    profile = args.profile or bool(raw_data.get("profile", False))
+
+    logger = setup_site(raw_data, auto_refresh=daemon)
+
+    if not daemon:
+        run_once(raw_data, logger, profile)
+        return
+
+    # Daemon mode: connection pool, caches and token stay warm between runs
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    scheduler.run_forever(
+        lambda: run_once(raw_data, logger, profile),
+        raw_data["cron"],
+        run_timeout=raw_data.get("runTimeout"),
+        logger=logger,
+        stop_event=stop_event,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# metrics.py
+#
+# In-process request metrics for Query / query_utils.
+#
+# Counters and histograms are keyed by (method, endpoint, retrieval_mode) so a
+# run can be broken down into e.g. GET /readings AVERAGE vs GET /datapoints.
+# Read them with snapshot() or dump them in Prometheus text format with
+# to_prometheus() / write_prometheus().
+
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LABELS = ("method", "endpoint", "retrieval_mode")
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(self.cumulative()),
+        }
+
+class Metrics:
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        self.latency_buckets = latency_buckets
+        self.size_buckets = size_buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}   # (method, endpoint, mode, status) -> count
+            self.errors = {}     # (method, endpoint, mode, error) -> count
+            self.latency = {}    # (method, endpoint, mode) -> Histogram (seconds)
+            self.sizes = {}      # (method, endpoint, mode) -> Histogram (bytes)
+
+    def record_request(self, method, endpoint, retrieval_mode, status, seconds, size, error=None):
+        key = (method, endpoint, retrieval_mode or "")
+        with self._lock:
+            status_key = key + (str(status) if status is not None else "none",)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            if error is not None:
+                error_key = key + (error,)
+                self.errors[error_key] = self.errors.get(error_key, 0) + 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(self.latency_buckets)
+                self.sizes[key] = Histogram(self.size_buckets)
+            self.latency[key].observe(seconds)
+            self.sizes[key].observe(size)
+
+    # Plain-dict view: {"requests": [...], "errors": [...], "latency": [...], "sizes": [...]}
+    def snapshot(self):
+        with self._lock:
+            return {
+                "requests": [dict(zip(LABELS + ("status",), k), count=v) for k, v in self.requests.items()],
+                "errors": [dict(zip(LABELS + ("error",), k), count=v) for k, v in self.errors.items()],
+                "latency": [dict(zip(LABELS, k), **h.as_dict()) for k, h in self.latency.items()],
+                "sizes": [dict(zip(LABELS, k), **h.as_dict()) for k, h in self.sizes.items()],
+            }
+
+    def to_prometheus(self, prefix="dsxos_client"):
+        lines = []
+        with self._lock:
+            _counter(lines, f"{prefix}_http_requests_total", "HTTP requests by status.",
+                     LABELS + ("status",), self.requests)
+            _counter(lines, f"{prefix}_http_errors_total", "Failed HTTP requests by error type.",
+                     LABELS + ("error",), self.errors)
+            _histogram(lines, f"{prefix}_http_request_duration_seconds", "HTTP request latency.",
+                       self.latency)
+            _histogram(lines, f"{prefix}_http_response_size_bytes", "HTTP response body size.",
+                       self.sizes)
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, prefix="dsxos_client"):
+        with open(path, "w") as f:
+            f.write(self.to_prometheus(prefix))
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+def _counter(lines, name, help_text, names, values):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} counter")
+    for key, count in sorted(values.items()):
+        lines.append(f"{name}{_labels(names, key)} {count}")
+
+def _histogram(lines, name, help_text, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, h in sorted(histograms.items()):
+        for bound, count in h.cumulative():
+            lines.append(f"{name}_bucket{_labels(LABELS, key, ('le', bound))} {count}")
+        lines.append(f"{name}_bucket{_labels(LABELS, key, ('le', '+Inf'))} {h.count}")
+        lines.append(f"{name}_sum{_labels(LABELS, key)} {h.sum}")
+        lines.append(f"{name}_count{_labels(LABELS, key)} {h.count}")
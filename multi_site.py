@@ -0,0 +1,120 @@
+# multi_site.py
+#
+# Runs the application once for every site config (*.yaml / *.yml) in a
+# directory, on a pool of worker processes:
+#
+#   python multi_site.py /app/sites --workers 8 --output-dir /app/site-output
+#
+# query_utils keeps its connection pool, token, caches and registry in module
+# globals, so each site runs in a worker process and gets query_utils
+# re-initialised for it; a worker runs one site at a time. Separate processes
+# also let CPU-bound optimisation of different sites run in parallel.
+# Within a worker, sites on the same apiEndpoint share the keep-alive
+# connection pool, and sites with the same apiEndpoint and clientId (i.e. the
+# same view of the API) share the response cache. Every site logs to its own
+# logger and <output-dir>/<site>/query.log, with a "site" Loki tag, and
+# writes its own metrics.prom there.
+
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import yaml
+import main as app
+import query_utils
+from metrics import Metrics
+from Query import ResponseCache, SessionPool
+
+# Per worker process, reused by every site that worker runs
+_endpoint_pools = {}   # apiEndpoint -> SessionPool
+_endpoint_caches = {}  # (apiEndpoint, clientId) -> ResponseCache
+
+def find_configs(config_dir):
+    paths = glob.glob(os.path.join(config_dir, "*.yaml")) + glob.glob(os.path.join(config_dir, "*.yml"))
+    return sorted(paths)
+
+# Run one site; returns (site, error message or None, seconds)
+def run_site(config_path, output_dir, profile=False):
+    site = os.path.splitext(os.path.basename(config_path))[0]
+    start = time.perf_counter()
+    logger = None
+    try:
+        with open(config_path, "r") as f:
+            raw_data = yaml.safe_load(f)
+        params = raw_data["params"]
+        site_dir = os.path.join(output_dir, site)
+        os.makedirs(site_dir, exist_ok=True)
+        log_file = os.path.join(site_dir, "query.log")
+
+        pool = _endpoint_pools.get(params["apiEndpoint"])
+        if pool is None:
+            pool = _endpoint_pools[params["apiEndpoint"]] = SessionPool()
+        cache_key = (params["apiEndpoint"], params["clientId"])
+        response_cache = _endpoint_caches.get(cache_key)
+        if response_cache is None:
+            response_cache = _endpoint_caches[cache_key] = ResponseCache()
+
+        logger = app.setup_site(
+            raw_data,
+            log_file=log_file,
+            logger_name=f"{app.APP_NAME}.{site}",
+            loki_tags={"site": site},
+            pool=pool,
+            response_cache=response_cache,
+            metrics=Metrics(),
+        )
+        app.run_once(raw_data, logger, profile or bool(raw_data.get("profile", False)),
+                     log_file=log_file, metrics_path=os.path.join(site_dir, "metrics.prom"))
+        return site, None, time.perf_counter() - start
+    except Exception as e:
+        if logger is not None:
+            logger.exception(f"Site {site} failed")
+        return site, f"{type(e).__name__}: {e}", time.perf_counter() - start
+    finally:
+        query_utils.close_write_buffer()
+        if logger is not None:
+            for handler in logger.handlers:
+                handler.close()  # Pushes the remaining Loki records
+            logger.handlers = []
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Run {app.APP_NAME} once for every site config in a directory")
+    parser.add_argument("config_dir", help="Directory of site config YAML files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--output-dir", default="sites", help="Directory for per-site logs, metrics and profiles")
+    parser.add_argument("--profile", action="store_true", help="Profile every site run (see main.py --profile)")
+    args = parser.parse_args()
+
+    # Not on the root logger: site loggers propagate there and have their own handlers
+    logger = logging.getLogger("multi_site")
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    configs = find_configs(args.config_dir)
+    if not configs:
+        logger.error(f"No site configs found in {args.config_dir}")
+        sys.exit(1)
+
+    failed = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(configs))) as executor:
+        futures = [executor.submit(run_site, path, args.output_dir, args.profile) for path in configs]
+        for future in as_completed(futures):
+            site, error, seconds = future.result()
+            if error is None:
+                logger.info(f"{site}: done in {seconds:.1f} s")
+            else:
+                failed.append(site)
+                logger.error(f"{site}: failed after {seconds:.1f} s: {error}")
+
+    logger.info(f"{len(configs) - len(failed)} of {len(configs)} sites succeeded in "
+                f"{time.perf_counter() - start:.1f} s")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
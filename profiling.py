@@ -0,0 +1,130 @@
+# profiling.py
+#
+# Opt-in profiling of one application run (main.py --profile):
+# - spans for every public query_utils / Util function, every HTTP request
+#   (Query._request) and every Loki push, written as Chrome trace-event JSON
+#   (open in chrome://tracing or https://ui.perfetto.dev)
+# - cProfile statistics of the thread running the application: the main
+#   thread, or the scheduler's worker thread in daemon mode (python -m pstats <file>)
+
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+class Tracer:
+    """Collects Chrome trace "complete" events (name, category, start, duration, thread)."""
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        start = time.perf_counter()
+        try:
+            yield args  # callers may add args (e.g. the HTTP status) while the span runs
+        finally:
+            end = time.perf_counter()
+            event = {
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": (start - self._origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": self._pid,
+                "tid": threading.get_ident(),
+            }
+            if args:
+                event["args"] = {k: v if isinstance(v, (int, float, bool, type(None))) else str(v)
+                                 for k, v in args.items()}
+            with self._lock:
+                self.events.append(event)
+
+    def write(self, path):
+        with self._lock:
+            events = list(self.events)
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": names[tid]}}
+            for tid in {e["tid"] for e in events} if tid in names
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+def _traced(tracer, func, name, cat):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.span(name, cat):
+            return func(*args, **kwargs)
+    return wrapper
+
+def _traced_request(tracer, request):
+    @functools.wraps(request)
+    def wrapper(self, method, endpoint, *args, **kwargs):
+        params = kwargs.get("params") or {}
+        with tracer.span(f"{method} {endpoint}", "http", retrievalMode=params.get("retrievalMode")) as span_args:
+            result = request(self, method, endpoint, *args, **kwargs)
+            span_args["ok"] = result is not None
+            return result
+    return wrapper
+
+class Profiler:
+    """Instruments query_utils, Util, Query and LokiHandler for one run and writes the results.
+
+    Use as a context manager around the run, on the thread that runs it (cProfile
+    only sees the thread that enters the Profiler); on exit the trace is written to
+    <prefix>.trace.json and the cProfile stats to <prefix>.prof, and all
+    instrumentation is removed again.
+    """
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.tracer = Tracer()
+        self.profile = cProfile.Profile()
+        self._patched = []  # (owner, attribute name, original)
+
+    def __enter__(self):
+        import query_utils
+        import Util
+        from Query import Query
+        from logger import LokiHandler
+
+        for module, cat in ((query_utils, "query_utils"), (Util, "util")):
+            for name, func in vars(module).items():
+                if (inspect.isfunction(func) and func.__module__ == module.__name__
+                        and not name.startswith("_") and name != "Q"):
+                    self._patch(module, name, _traced(self.tracer, func, f"{module.__name__}.{name}", cat))
+        self._patch(Query, "_request", _traced_request(self.tracer, Query._request))
+        self._patch(LokiHandler, "_push", _traced(self.tracer, LokiHandler._push, "LokiHandler._push", "loki"))
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched.clear()
+        self.tracer.write(f"{self.prefix}.trace.json")
+        self.profile.dump_stats(f"{self.prefix}.prof")
+        return False
+
+    def span(self, name, cat="app", **args):
+        return self.tracer.span(name, cat, **args)
+
+    def _patch(self, owner, name, replacement):
+        self._patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+# Output prefix for a run next to log_file, e.g. query.log -> query.20260518T101500Z,
+# or in directory (created if missing) when one is given
+def run_prefix(log_file, directory=None):
+    base, _ = os.path.splitext(log_file)
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, os.path.basename(base))
+    return f"{base}.{time.strftime('%Y%m%dT%H%M%SZ', time.gmtime())}"
@@ -1,22 +1,92 @@
+import hashlib
 import logging
-from Query import Query
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from Query import Query, RequestPolicy, ResponseCache, SessionPool
+from metrics import Metrics
+from token_manager import TokenManager, ensure_private_dir
+from write_buffer import WriteBuffer
+from datapoint_registry import DatapointRegistry
+from TimeSeries import TimeSeries
+from timestamps import epoch_us, format_epoch_us, format_times
+import retrieval_modes
 import Util
 
 _query_url = None
 _query_headers = None
+_query_pool = None
+_owns_pool = False
+_readings_cache = None
+_token_manager = None
+_request_policy = None
+_response_cache = None
+_datapoint_registry = None
+_prognosis_max_age = 60
+_write_buffer = None
+_metrics = Metrics()
 _logger = logging.getLogger(__name__)
 
-def init(url, headers, logger=None):
-    global _query_url, _query_headers, _logger
+# Default directory for state kept between runs (the cached access token):
+# per user, $XDG_STATE_HOME/dsxos-app or ~/.local/state/dsxos-app
+STATE_DIR = os.path.join(
+    os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state"),
+    "dsxos-app",
+)
+
+# pool_connections / pool_maxsize / pool_block are passed to SessionPool:
+# number of hosts to pool, max keep-alive connections per host and whether to
+# block when the per-host limit is reached.
+# readings_cache: optional readings_cache.ReadingsCache consulted by
+# get_readings for FULL readings.
+# request_policy: optional Query.RequestPolicy for adaptive per-endpoint
+# timeouts and hedged GETs; pass True for the default settings.
+# response_cache: optional Query.ResponseCache serving repeated GETs (e.g.
+# /datapoints lookups) from memory or with a 304; pass True for the defaults.
+# pool: an existing SessionPool to use (and not close) instead of a new one,
+# e.g. shared by several sites on the same API endpoint.
+# metrics: Metrics instance to record requests in from now on.
+def init(url, headers, logger=None, pool_connections=10, pool_maxsize=10, pool_block=False,
+         readings_cache=None, request_policy=None, response_cache=None, pool=None, metrics=None):
+    global _query_url, _query_headers, _query_pool, _readings_cache, _token_manager, _request_policy, _logger
+    global _response_cache, _datapoint_registry, _owns_pool, _metrics
+    if _write_buffer is not None:
+        close_write_buffer()  # Writes queued for the previous URL go there first
     _query_url = url
     _query_headers = headers
+    _readings_cache = readings_cache
+    _request_policy = RequestPolicy() if request_policy is True else request_policy
+    _response_cache = ResponseCache() if response_cache is True else response_cache
+    _token_manager = None
+    _datapoint_registry = None
+    if _query_pool is not None and _owns_pool:
+        _query_pool.close()
+    _owns_pool = pool is None
+    _query_pool = pool if pool is not None else SessionPool(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
+    )
+    if metrics is not None:
+        _metrics = metrics
     if logger is not None:
         _logger = logger
     _logger.debug(f"query_utils initialized with URL: {_query_url}")
 
 # Helper to create Query object
 def Q():
-    return Query(_query_url, headers=_query_headers, logger=_logger)
+    return Query(_query_url, headers=_query_headers, logger=_logger, pool=_query_pool, metrics=_metrics,
+                 auth=_token_manager, policy=_request_policy, cache=_response_cache)
+
+# Request counters, latency and response size histograms of all Q() calls,
+# per (method, endpoint, retrieval mode). See metrics.Metrics.
+def get_metrics():
+    return _metrics
+
+# Write the collected request metrics in Prometheus text format
+def write_metrics(path):
+    _metrics.write_prometheus(path)
 
 def add_header(key, value):
     global _query_headers
@@ -30,15 +100,80 @@ def add_header(key, value):
 
 # Get access token using client credentials flow
 def get_token(client_id, api_token):
-    token_data = Q()._request("POST", "/auth/token", data={ "grant_type":"client_credentials", "client_id":client_id, "client_secret":api_token })
+    token_data = request_token(client_id, api_token)
     return token_data["access_token"]
 
+# Full /auth/token response ({"access_token", "expires_in", ...})
+def request_token(client_id, api_token):
+    q = Query(_query_url, headers=_query_headers, logger=_logger, pool=_query_pool, metrics=_metrics)
+    return q._request("POST", "/auth/token", data={ "grant_type":"client_credentials", "client_id":client_id, "client_secret":api_token })
+
+# Authenticate every Q() request with a token cached on disk (see TokenManager)
+# instead of fetching one per run with get_token. The token is reused across
+# runs until refresh_margin seconds before it expires, and refreshed once on a
+# 401. auto_refresh renews it in the background for long-lived processes.
+# cache_path defaults to a file per API URL + client ID in state_dir
+# (default STATE_DIR), which must be a directory of the current user with
+# mode 0700 (it is created so if missing; see token_manager.ensure_private_dir).
+def enable_token_manager(client_id, api_token, cache_path=None, refresh_margin=300, auto_refresh=False,
+                         state_dir=None):
+    global _token_manager
+    if cache_path is None:
+        state_dir = ensure_private_dir(state_dir or STATE_DIR)
+        key = hashlib.sha1(f"{_query_url}|{client_id}".encode("utf-8")).hexdigest()[:12]
+        cache_path = os.path.join(state_dir, f".token_{key}.json")
+    _token_manager = TokenManager(
+        lambda: request_token(client_id, api_token),
+        cache_path=cache_path,
+        refresh_margin=refresh_margin,
+        logger=_logger,
+    )
+    if auto_refresh:
+        _token_manager.start_auto_refresh()
+    return _token_manager
+
+###########################################################
+# Datapoint registry
+###########################################################
+
+# Load datapoint metadata once and answer identifier / id lookups of all
+# helpers from memory (see datapoint_registry.DatapointRegistry).
+# identifiers: datapoints to load (default: all, in one paginated sweep).
+# max_age: seconds before an entry is re-fetched on its next lookup.
+# prognosis_max_age: the same for helpers reading lastPrognosisId, which
+# changes when other apps post prognoses.
+# Call after authentication is set up (e.g. enable_token_manager).
+def enable_datapoint_registry(identifiers=None, max_age=300, prognosis_max_age=60, page_size=1000):
+    global _datapoint_registry, _prognosis_max_age
+    _prognosis_max_age = prognosis_max_age
+    _datapoint_registry = DatapointRegistry(
+        _fetch_datapoints, identifiers=identifiers, page_size=page_size, max_age=max_age, logger=_logger
+    )
+    _datapoint_registry.load()
+    return _datapoint_registry
+
+def get_datapoint_registry():
+    return _datapoint_registry
+
+def _fetch_datapoints(filters, page, size):
+    return Q().filter(**filters).paginate(page=page, size=size).get("/datapoints")
+
+# lastPrognosisId of a datapoint, at most prognosis_max_age old with a registry
+def _last_prognosis_id(dp_identifier):
+    if _datapoint_registry is not None:
+        dp = _datapoint_registry.get(dp_identifier, max_age=_prognosis_max_age)
+        return dp.get("lastPrognosisId") if dp is not None else None
+    return get_datapoint(dp_identifier)[0].get("lastPrognosisId")
+
 ###########################################################
 # GET
 ###########################################################
 
-# GET datapoint data
+# GET datapoint data (a list with the datapoint, [] if it does not exist)
 def get_datapoint(dp_identifier):
+    if _datapoint_registry is not None:
+        dp = _datapoint_registry.get(dp_identifier)
+        return [dict(dp)] if dp is not None else []
     dp_data = (
         Q()
         .filter(identifier__equals=dp_identifier)
@@ -50,6 +185,8 @@ def get_datapoint(dp_identifier):
 
 # GET datapoint ID
 def get_datapoint_ID(dp_identifier):
+    if _datapoint_registry is not None:
+        return _datapoint_registry.get(dp_identifier)["id"]
     dp_data = (
         Q()
         .filter(identifier__equals=dp_identifier)
@@ -58,6 +195,27 @@ def get_datapoint_ID(dp_identifier):
     )
     return dp_data[0]["id"]
 
+# GET datapoint data for many identifiers with a single /datapoints query
+# Returns {identifier: datapoint}; unknown identifiers are left out.
+def get_datapoints(dp_identifiers):
+    dp_identifiers = list(dp_identifiers)
+    if not dp_identifiers:
+        return {}
+    if _datapoint_registry is not None:
+        return {i: dict(dp) for i, dp in _datapoint_registry.get_many(dp_identifiers).items()}
+    dp_data = (
+        Q()
+        .filter(identifier__in=",".join(dp_identifiers))
+        .paginate(page=0, size=len(dp_identifiers))
+        .get("/datapoints")
+    ) or []
+    return {dp["identifier"]: dp for dp in dp_data}
+
+# GET datapoint IDs for many identifiers with a single /datapoints query
+# Returns {identifier: id}; unknown identifiers are left out.
+def get_datapoint_IDs(dp_identifiers):
+    return {identifier: dp["id"] for identifier, dp in get_datapoints(dp_identifiers).items()}
+
 # Get datapoint last reading by identifier
 def get_last_reading(dp_identifier):
     dp_data = get_datapoint(dp_identifier)
@@ -120,156 +278,391 @@ def get_last_reading_value(dp_identifier):
 #
 # Time params: ISO-8601 strings, e.g. "2026-05-20T00:00:00Z"
 # Returns a list of {"id", "time", "value", "datapointId"} dicts, or [] on error.
+# With as_series=True returns a TimeSeries (int64 epoch + float64 value arrays)
+# instead; the get_readings_* helpers below accept as_series as well.
+# stream=True (with as_series and ijson installed) parses the response body
+# incrementally instead of decoding it whole: slower, but the raw body and the
+# reading dicts are never held in memory, for very large pages.
+#
+# If init() was given a readings_cache, FULL requests with a from_time (and
+# page=0) are served from the cache, fetching only readings newer than what
+# is already cached; a failed fetch then raises RuntimeError, as
+# get_full_readings does. Pass use_cache=False to always go to the API.
 def get_readings(dp_identifier, from_time=None, to_time=None,
                  retrieval_mode=None, interval_seconds=None,
                  rollover_value=None, edge_type=None,
-                 page=0, size=10000):
+                 page=0, size=10000, as_series=False, use_cache=True, stream=False):
     dp_id = get_datapoint_ID(dp_identifier)
-    q = Q().filter(datapointId__equals=dp_id)
+    if (use_cache and _readings_cache is not None and retrieval_mode in (None, "FULL")
+            and from_time is not None and page == 0):
+        readings = _get_cached_readings(dp_id, from_time, to_time, size)
+        if as_series:
+            return TimeSeries.from_readings(readings, datapoint_id=dp_id)
+        return readings
+
+    q = Q().filter(**readings_filters(dp_id, from_time, to_time, retrieval_mode,
+                                      interval_seconds, rollover_value, edge_type))
+    q = q.paginate(page=page, size=size)
+    if as_series and stream:
+        # Parse the response stream straight into arrays
+        readings = q.get("/readings", parser=lambda response: TimeSeries.from_json(response.raw, dp_id))
+        if readings is None:
+            readings = TimeSeries([], [], dp_id)
+    elif as_series:
+        readings = TimeSeries.from_readings(q.get("/readings") or [], datapoint_id=dp_id)
+    else:
+        readings = q.get("/readings") or []
+    if len(readings) >= size:
+        _logger.warning("get_readings(%s): page %d is full (size=%d), more readings may exist; "
+                        "use iter_readings to fetch all pages", dp_identifier, page, size)
+    return readings
+
+# Stream all pages of /readings for a datapoint, ordered by time.
+# Walks page 0, 1, ... until a short page is returned, fetching the next page
+# in the background while the caller processes the current one (prefetch).
+# Yields individual reading dicts, or whole pages (lists) when chunks=True.
+# Raises RuntimeError if a page request fails, so a range is never silently
+# incomplete. Other arguments match get_readings.
+def iter_readings(dp_identifier, from_time=None, to_time=None,
+                  retrieval_mode=None, interval_seconds=None,
+                  rollover_value=None, edge_type=None,
+                  page_size=10000, chunks=False, prefetch=True):
+    dp_id = get_datapoint_ID(dp_identifier)
+    filters = readings_filters(dp_id, from_time, to_time, retrieval_mode,
+                               interval_seconds, rollover_value, edge_type)
+    for readings in _iter_reading_pages(filters, page_size, prefetch, dp_identifier):
+        if chunks:
+            yield readings
+        else:
+            yield from readings
+
+# Pages of /readings for the given filters, see iter_readings
+def _iter_reading_pages(filters, page_size, prefetch, dp_identifier):
+    def fetch(page):
+        return (
+            Q()
+            .filter(**filters)
+            .order_by("time", "asc")
+            .paginate(page=page, size=page_size)
+            .get("/readings")
+        )
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        page = 0
+        future = pool.submit(fetch, page)
+        while True:
+            readings = future.result()
+            if readings is None:
+                raise RuntimeError(f"Failed to fetch readings page {page} for datapoint {dp_identifier}")
+            has_more = len(readings) >= page_size
+            if has_more and prefetch:
+                future = pool.submit(fetch, page + 1)
+
+            yield readings
+
+            if not has_more:
+                return
+            page += 1
+            if not prefetch:
+                future = pool.submit(fetch, page)
+
+# FULL readings in [from_time, to_time) through the readings cache: only the
+# part after the cached coverage is fetched (all pages), then the whole range
+# is read back from the cache. The coverage only grows up to the newest
+# reading fetched, so readings that arrive later for times after it are
+# fetched next time. Raises RuntimeError if a page request fails.
+def _get_cached_readings(dp_id, from_time, to_time, page_size):
+    now_us = epoch_us(datetime.now(timezone.utc))
+    from_us = epoch_us(from_time)
+    to_us = epoch_us(to_time) if to_time is not None else now_us
+    fetch_to_us = min(to_us, now_us)  # never mark the future as covered
+    fetch_from_us = _readings_cache.fetch_start(dp_id, from_us)
+
+    if fetch_from_us < fetch_to_us:
+        filters = readings_filters(dp_id, format_epoch_us(fetch_from_us), format_epoch_us(fetch_to_us), "FULL")
+        fetched = [r for page in _iter_reading_pages(filters, page_size, True, dp_id) for r in page]
+        if fetched:
+            covered_to_us = min(fetch_to_us, epoch_us(fetched[-1]["time"]) + 1)
+            _readings_cache.store(dp_id, fetched, fetch_from_us, covered_to_us)
+        _logger.debug("readings cache: datapoint %s fetched %d new readings", dp_id, len(fetched))
+
+    readings = _readings_cache.read(dp_id, from_us, to_us)
+    _readings_cache.evict(dp_id)
+    if to_us > fetch_to_us:
+        # Part of the range lies in the future: anything already stored there is not cached
+        filters = readings_filters(dp_id, format_epoch_us(fetch_to_us), format_epoch_us(to_us), "FULL")
+        readings += [r for page in _iter_reading_pages(filters, page_size, True, dp_id) for r in page]
+    return readings
+
+# Compute one or more retrieval modes locally from a single FULL fetch.
+# modes: a retrieval mode name or a list of them (see the table above); all
+# modes share interval_seconds / rollover_value / edge_type. FULL readings
+# come from the readings cache when configured, otherwise every page of the
+# window is fetched. Buckets start at from_time (see retrieval_modes.py).
+# CYCLIC / START_BOUND / VALUE_STATE also fetch the last reading before
+# from_time, and END_BOUND the first reading at or after to_time, so the
+# values carried into the first / last boundary are known.
+# Returns {mode: list of {"time", "value", "datapointId"} dicts}, or
+# {mode: TimeSeries} with as_series=True.
+def get_readings_local(dp_identifier, from_time, to_time, modes,
+                       interval_seconds=None, rollover_value=None, edge_type=None,
+                       size=10000, as_series=False):
+    if isinstance(modes, str):
+        modes = [modes]
+    full = get_full_readings(dp_identifier, from_time, to_time, size=size, as_series=True)
+    upper = {(mode or "FULL").upper() for mode in modes}
+    edges = []
+    if upper & retrieval_modes.CARRY_IN_MODES:
+        edges += _edge_reading(dp_identifier, {"time__lessThan": _api_time(from_time)}, "desc")
+    if "END_BOUND" in upper:
+        edges += _edge_reading(dp_identifier, {"time__greaterThanOrEqual": _api_time(to_time)}, "asc")
+    if edges:
+        edges = TimeSeries.from_readings(edges)
+        full = TimeSeries(np.r_[full.epoch_us, edges.epoch_us], np.r_[full.values, edges.values],
+                          full.datapoint_id)
+    from_us = epoch_us(from_time)
+    to_us = epoch_us(to_time)
+
+    results = {}
+    for mode in modes:
+        series = retrieval_modes.compute(full, mode, from_us, to_us, interval_seconds,
+                                         rollover_value, edge_type)
+        results[mode] = series if as_series else series.to_readings()
+    return results
+
+# The one reading nearest to a window edge: time_filter is time__lessThan
+# (with order "desc") or time__greaterThanOrEqual (with "asc"). Returns a list
+# of at most one reading dict.
+def _edge_reading(dp_identifier, time_filter, order):
+    return (
+        Q()
+        .filter(datapointId__equals=get_datapoint_ID(dp_identifier), **time_filter)
+        .order_by("time", order)
+        .paginate(page=0, size=1)
+        .get("/readings")
+    ) or []
+
+# All FULL readings in [from_time, to_time): through the readings cache when
+# configured, otherwise by walking every page. Raises RuntimeError if a page
+# request fails.
+def get_full_readings(dp_identifier, from_time, to_time, size=10000, as_series=False):
+    if _readings_cache is not None:
+        return get_readings(dp_identifier, from_time, to_time, retrieval_mode="FULL",
+                            size=size, as_series=as_series)
+    dp_id = get_datapoint_ID(dp_identifier)
+    filters = readings_filters(dp_id, from_time, to_time, "FULL")
+    readings = [r for page in _iter_reading_pages(filters, size, True, dp_identifier) for r in page]
+    if as_series:
+        return TimeSeries.from_readings(readings, datapoint_id=dp_id)
+    return readings
+
+# Fetch readings for many datapoints in parallel on a bounded worker pool.
+# Identifiers are resolved with one /datapoints query, then the /readings
+# calls run concurrently on max_workers threads (one per datapoint).
+# Arguments otherwise match get_readings.
+# Returns (readings, errors):
+#   readings: {identifier: list of reading dicts (TimeSeries if as_series)}
+#             for every successful fetch
+#   errors:   {identifier: error message} for identifiers that failed
+def get_readings_many(dp_identifiers, from_time=None, to_time=None,
+                      retrieval_mode=None, interval_seconds=None,
+                      rollover_value=None, edge_type=None,
+                      page=0, size=10000, max_workers=8, as_series=False, stream=False):
+    dp_identifiers = list(dict.fromkeys(dp_identifiers))
+    readings = {}
+    errors = {}
+    if not dp_identifiers:
+        return readings, errors
+
+    dp_ids = get_datapoint_IDs(dp_identifiers)
+    for dp_identifier in dp_identifiers:
+        if dp_identifier not in dp_ids:
+            errors[dp_identifier] = "datapoint not found"
+
+    def fetch(dp_id):
+        parser = (lambda response: TimeSeries.from_json(response.raw, dp_id)) if as_series and stream else None
+        return (
+            Q()
+            .filter(**readings_filters(dp_id, from_time, to_time, retrieval_mode,
+                                       interval_seconds, rollover_value, edge_type))
+            .paginate(page=page, size=size)
+            .get("/readings", parser=parser)
+        )
+
+    if dp_ids:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(dp_ids))) as pool:
+            futures = {dp_identifier: pool.submit(fetch, dp_id) for dp_identifier, dp_id in dp_ids.items()}
+            for dp_identifier, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[dp_identifier] = str(e)
+                    continue
+                if result is None:
+                    errors[dp_identifier] = "readings request failed"
+                elif as_series and not isinstance(result, TimeSeries):
+                    readings[dp_identifier] = TimeSeries.from_readings(result, datapoint_id=dp_ids[dp_identifier])
+                else:
+                    readings[dp_identifier] = result
+
+    if errors:
+        _logger.warning("get_readings_many: %d of %d datapoints failed: %s",
+                        len(errors), len(dp_identifiers), errors)
+    return readings, errors
+
+def _api_time(time_val):
+    return time_val if isinstance(time_val, str) else format_epoch_us(epoch_us(time_val))
+
+# /readings filter kwargs for Query.filter(), shared with async_query_utils
+# from_time / to_time: ISO-8601 strings or datetimes (sent as UTC "...Z")
+def readings_filters(dp_id, from_time=None, to_time=None,
+                     retrieval_mode=None, interval_seconds=None,
+                     rollover_value=None, edge_type=None):
+    filters = {"datapointId__equals": dp_id}
     if from_time is not None:
-        q = q.filter(time__greaterThanOrEqual=from_time)
+        filters["time__greaterThanOrEqual"] = _api_time(from_time)
     if to_time is not None:
-        q = q.filter(time__lessThan=to_time)
+        filters["time__lessThan"] = _api_time(to_time)
     if retrieval_mode is not None:
-        q = q.filter(retrievalMode=retrieval_mode)
+        filters["retrievalMode"] = retrieval_mode
     if interval_seconds is not None:
-        q = q.filter(intervalSeconds=interval_seconds)
+        filters["intervalSeconds"] = interval_seconds
     if rollover_value is not None:
-        q = q.filter(rolloverValue=rollover_value)
+        filters["rolloverValue"] = rollover_value
     if edge_type is not None:
-        q = q.filter(edgeType=edge_type)
-    return q.paginate(page=page, size=size).get("/readings") or []
+        filters["edgeType"] = edge_type
+    return filters
 
 # Raw readings for a time range — no preprocessing.
 # Use for: data export, auditing, feeding into custom analysis.
-def get_readings_full(dp_identifier, from_time, to_time, size=10000):
+def get_readings_full(dp_identifier, from_time, to_time, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
-                        retrieval_mode="FULL", size=size)
+                        retrieval_mode="FULL", size=size, as_series=as_series)
 
 # Value-change events only — consecutive duplicate values are suppressed.
 # Use for: state-change sensors, discrete signals, noise reduction.
-def get_readings_delta(dp_identifier, from_time, to_time, size=10000):
+def get_readings_delta(dp_identifier, from_time, to_time, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
-                        retrieval_mode="DELTA", size=size)
+                        retrieval_mode="DELTA", size=size, as_series=as_series)
 
 # Step-interpolated resampling at fixed interval boundaries.
 # Each point carries the last known value forward (no smoothing).
 # Use for: chart rendering at a fixed resolution, dashboard time-series.
 # interval_seconds: e.g. 900 = 15 min, 3600 = 1 hour
-def get_readings_cyclic(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_cyclic(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="CYCLIC",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Linearly interpolated resampling at fixed interval boundaries.
 # Use for: smooth trend lines, when gradual change between readings is assumed.
 # interval_seconds: e.g. 900 = 15 min, 3600 = 1 hour
-def get_readings_interpolated(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_interpolated(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="INTERPOLATED",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Min+max reading per bucket with original timestamps — preserves trend shape.
 # Use for: downsampling dense series for display while keeping visual peaks/troughs.
 # interval_seconds: bucket size, e.g. 3600 = hourly min+max pairs
-def get_readings_best_fit(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_best_fit(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="BEST_FIT",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Arithmetic mean of sample values per bucket.
 # Use for: statistical reporting, hourly/daily averages of sampled data.
 # interval_seconds: bucket size, e.g. 3600 = hourly averages
-def get_readings_average(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_average(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="AVERAGE",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Minimum value per bucket.
 # Use for: trough detection, minimum load/production per period.
-def get_readings_minimum(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_minimum(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="MINIMUM",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Maximum value per bucket.
 # Use for: peak detection, maximum load/production per period.
-def get_readings_maximum(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_maximum(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="MAXIMUM",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Trapezoidal integral (area under the value-vs-time curve) per bucket.
 # Result unit = original_unit × seconds. Divide by 3600 to get Wh from W readings.
 # Use for: energy accounting, cumulative consumption/production over a period.
 # interval_seconds: integration window, e.g. 3600 = 1 hour → result in W×s → /3600 = Wh
-def get_readings_integral(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_integral(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="INTEGRAL",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Rate of change per bucket: Δvalue / Δtime (in seconds).
 # Multiply result by 3600 to express as Δvalue/hour.
 # Use for: ramp detection, rate-of-change alarms, derivative analysis.
 # interval_seconds: bucket size for the slope calculation
-def get_readings_slope(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_slope(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="SLOPE",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Net cumulative counter delta per bucket with rollover correction.
 # rollover_value: counter maximum (e.g. 65536 for a 16-bit counter); None = no rollover handling.
 # Use for: utility meters, pulse counters, any monotonically increasing counter that wraps.
-def get_readings_counter(dp_identifier, from_time, to_time, interval_seconds, rollover_value=None, size=10000):
+def get_readings_counter(dp_identifier, from_time, to_time, interval_seconds, rollover_value=None, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="COUNTER",
                         interval_seconds=interval_seconds,
-                        rollover_value=rollover_value, size=size)
+                        rollover_value=rollover_value, size=size, as_series=as_series)
 
 # Time-weighted average per bucket using step (carry-forward) interpolation.
 # Unlike AVERAGE (arithmetic mean of samples), VALUE_STATE weights by time spent at each level.
 # Use for: discrete state signals, relay states, mode indicators.
-def get_readings_value_state(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_value_state(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="VALUE_STATE",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Time in seconds between consecutive rising edges (low→high, threshold=0).
 # Use for: cycle time analysis, heartbeat monitoring, periodic event duration.
 # No interval_seconds required.
-def get_readings_round_trip(dp_identifier, from_time, to_time, size=10000):
+def get_readings_round_trip(dp_identifier, from_time, to_time, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
-                        retrieval_mode="ROUND_TRIP", size=size)
+                        retrieval_mode="ROUND_TRIP", size=size, as_series=as_series)
 
 # State transition detection: +1 for rising edges, -1 for falling edges (threshold=0).
 # edge_type: "LEADING" (rising only), "TRAILING" (falling only), or None/"BOTH" (default).
 # Use for: event counting, alarm transitions, binary signal analysis.
 # No interval_seconds required.
-def get_readings_edge_detection(dp_identifier, from_time, to_time, edge_type=None, size=10000):
+def get_readings_edge_detection(dp_identifier, from_time, to_time, edge_type=None, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="EDGE_DETECTION",
-                        edge_type=edge_type, size=size)
+                        edge_type=edge_type, size=size, as_series=as_series)
 
 # Simple Linear Regression fitted on stored readings, evaluated at interval boundaries.
 # Use for: trend extrapolation, gap-filling, predictive analysis.
-def get_readings_predictive(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_predictive(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="PREDICTIVE",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # For each interval boundary: value of the last stored reading at or before it.
 # Use for: snapshot queries, audit trails, "what was the value at time T?" queries.
-def get_readings_start_bound(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_start_bound(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="START_BOUND",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # For each interval boundary: value of the first stored reading strictly after it.
 # Use for: forward-fill gaps, look-ahead queries, next-known-value retrieval.
-def get_readings_end_bound(dp_identifier, from_time, to_time, interval_seconds, size=10000):
+def get_readings_end_bound(dp_identifier, from_time, to_time, interval_seconds, size=10000, as_series=False):
     return get_readings(dp_identifier, from_time, to_time,
                         retrieval_mode="END_BOUND",
-                        interval_seconds=interval_seconds, size=size)
+                        interval_seconds=interval_seconds, size=size, as_series=as_series)
 
 # Get datapoint last control command by identifier
 def get_last_control(dp_identifier):
@@ -303,7 +696,7 @@ def get_last_control_value_and_status(dp_identifier):
 
 # GET datapoint last prognosis readings data
 def get_last_prognosis_readings(dp_identifier, generate_if_missing=False):
-    last_prognosis_id = get_datapoint(dp_identifier)[0].get("lastPrognosisId")
+    last_prognosis_id = _last_prognosis_id(dp_identifier)
     if last_prognosis_id is not None:
         last_prognosis_readings = (
             Q()
@@ -323,7 +716,7 @@ def get_last_prognosis_readings(dp_identifier, generate_if_missing=False):
 
 # GET datapoint's last datapoint prognosis
 def get_datapoint_prognosis(dp_identifier):
-    last_prognosis_id = get_datapoint(dp_identifier)[0].get("lastPrognosisId")
+    last_prognosis_id = _last_prognosis_id(dp_identifier)
     _logger.debug("lastPrognosisId = %s", last_prognosis_id)
     if last_prognosis_id is not None:
         datapoint_prognosis = (
@@ -337,29 +730,219 @@ def get_datapoint_prognosis(dp_identifier):
         _logger.warning(f"No prognosis available for datapoint {dp_identifier}.")
         return None
 
+# Latest reading, control value and prognosis of many datapoints at once.
+# Identifiers are resolved with one /datapoints query, the last prognosis
+# readings of all datapoints come from one datapointPrognosisId.in query, and
+# the latest /readings and /control-values run concurrently on max_workers
+# threads (the API has no "latest per datapoint" query).
+# include: any of "reading", "control", "prognosis"
+# Returns (snapshot, errors):
+#   snapshot: {identifier: {"datapoint": {...}, "reading": {...} or None,
+#                           "control": {...} or None, "prognosis": [...]}}
+#             (only the included keys besides "datapoint")
+#   errors:   {identifier: error message}
+def get_snapshot(dp_identifiers, include=("reading", "control", "prognosis"), max_workers=8):
+    dp_identifiers = list(dict.fromkeys(dp_identifiers))
+    if _datapoint_registry is not None and "prognosis" in include:
+        datapoints = {i: dict(dp) for i, dp in
+                      _datapoint_registry.get_many(dp_identifiers, max_age=_prognosis_max_age).items()}
+    else:
+        datapoints = get_datapoints(dp_identifiers)
+    errors = {i: "datapoint not found" for i in dp_identifiers if i not in datapoints}
+    snapshot = {i: {"datapoint": dp} for i, dp in datapoints.items()}
+    if not datapoints:
+        return snapshot, errors
+
+    def latest(endpoint, dp_id):
+        return (
+            Q()
+            .filter(datapointId__equals=dp_id)
+            .order_by("time", "desc")
+            .paginate(page=0, size=1)
+            .get(endpoint)
+        )
+
+    def prognosis_readings(prognosis_ids):
+        readings = []
+        page = 0
+        while True:
+            batch = (
+                Q()
+                .filter(datapointPrognosisId__in=",".join(str(p) for p in prognosis_ids))
+                .paginate(page=page, size=10000)
+                .get("/prognosis-readings")
+            )
+            if batch is None:
+                return None
+            readings.extend(batch)
+            if len(batch) < 10000:
+                return readings
+            page += 1
+
+    endpoints = {"reading": "/readings", "control": "/control-values"}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        prognosis_ids = {dp.get("lastPrognosisId") for dp in datapoints.values()} - {None}
+        prognosis_future = None
+        if "prognosis" in include and prognosis_ids:
+            prognosis_future = pool.submit(prognosis_readings, sorted(prognosis_ids))
+
+        futures = {
+            (identifier, key): pool.submit(latest, endpoints[key], dp["id"])
+            for identifier, dp in datapoints.items()
+            for key in ("reading", "control") if key in include
+        }
+        for (identifier, key), future in futures.items():
+            try:
+                result = future.result()
+            except Exception as e:
+                result, message = None, str(e)
+            else:
+                message = f"{endpoints[key]} request failed"
+            if result is None:
+                errors[identifier] = message
+                snapshot[identifier][key] = None
+            else:
+                snapshot[identifier][key] = result[0] if result else None
+
+        if "prognosis" in include:
+            by_prognosis = {}
+            if prognosis_future is not None:
+                readings = prognosis_future.result()
+                if readings is None:
+                    for identifier, dp in datapoints.items():
+                        if dp.get("lastPrognosisId") is not None:
+                            errors[identifier] = "/prognosis-readings request failed"
+                    readings = []
+                for r in readings:
+                    by_prognosis.setdefault(r.get("datapointPrognosisId"), []).append(r)
+            for identifier, dp in datapoints.items():
+                snapshot[identifier]["prognosis"] = by_prognosis.get(dp.get("lastPrognosisId"), [])
+
+    if errors:
+        _logger.warning("get_snapshot: %d of %d datapoints had errors: %s",
+                        len(errors), len(dp_identifiers), errors)
+    return snapshot, errors
+
 ##########################################################
 # POST
 ##########################################################
 
 # POST prognosis readings
-def post_prognosis_readings(prognosis_readings_payload):
-    for reading in prognosis_readings_payload:
-        response = (Q().post("/prognosis-readings", json=reading))
-    return response
+# Readings are uploaded concurrently with at most max_in_flight requests open.
+# If the API offers a bulk endpoint accepting a JSON list of readings, pass it
+# as batch_endpoint to upload batch_size readings per request instead.
+# Returns one entry per reading, in payload order: the API response (for bulk
+# uploads: the matching list item if the API returns one, otherwise the whole
+# batch response), or None if that reading failed to upload.
+# Reading times may be datetimes or epoch microseconds; they are sent as
+# ISO-8601 UTC strings.
+def post_prognosis_readings(prognosis_readings_payload, max_in_flight=8,
+                            batch_endpoint=None, batch_size=500):
+    prognosis_readings_payload = format_times(prognosis_readings_payload)
+    if not prognosis_readings_payload:
+        return []
+
+    if batch_endpoint is not None:
+        batches = [prognosis_readings_payload[i:i + batch_size]
+                   for i in range(0, len(prognosis_readings_payload), batch_size)]
+
+        def post_batch(batch):
+            response = Q().post(batch_endpoint, json=batch)
+            if isinstance(response, list) and len(response) == len(batch):
+                return response
+            return [response] * len(batch)
+
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(batches))) as pool:
+            responses = [r for batch_responses in pool.map(post_batch, batches) for r in batch_responses]
+    else:
+        def post_reading(reading):
+            return Q().post("/prognosis-readings", json=reading)
+
+        with ThreadPoolExecutor(max_workers=min(max_in_flight, len(prognosis_readings_payload))) as pool:
+            responses = list(pool.map(post_reading, prognosis_readings_payload))
+
+    failed = sum(1 for r in responses if r is None)
+    if failed:
+        _logger.error("post_prognosis_readings: %d of %d readings failed to upload",
+                      failed, len(responses))
+    return responses
 
 # POST datapoint prognosis
-def post_datapoint_prognosis(prognosis_payload):
+# Extra keyword arguments (max_in_flight, batch_endpoint, batch_size) are
+# passed to post_prognosis_readings.
+#
+# Change-aware upload: with tolerance set, the new readings are first compared
+# with the datapoint's last prognosis (Util.diff_prognosis):
+#   - every reading matches within tolerance -> nothing is uploaded
+#   - with append_tail, if only readings after the last prognosis' end are new,
+#     just those are added to the last prognosis
+#   - otherwise a new prognosis is uploaded as usual
+#
+# Returns the created prognosis (the /datapoint-prognoses response) with
+# "readings" set to the post_prognosis_readings result: one entry per
+# reading, the API response or None if that reading failed to upload.
+# When nothing new was created, returns {"id": <last prognosis id>,
+# "upload": "skipped" | "tail", "readings": <results of the readings uploaded>}.
+# Returns None if the prognosis itself could not be created.
+def post_datapoint_prognosis(prognosis_payload, tolerance=None, append_tail=False, **upload_options):
+    prognosis_payload = {**prognosis_payload, "readings": format_times(prognosis_payload["readings"])}
+    if tolerance is not None:
+        result = _post_prognosis_changes(prognosis_payload, tolerance, append_tail, upload_options)
+        if result is not None:
+            return result
+
     response = (Q().post("/datapoint-prognoses", json=prognosis_payload))
+    if response is None:
+        return None
 
     prognosis_readings_payload = prognosis_payload["readings"]
     for dp_pr_id in prognosis_readings_payload:
         dp_pr_id["datapointPrognosisId"] = response["id"]
-    post_prognosis_readings(prognosis_readings_payload)
-
-    return response
+    reading_results = post_prognosis_readings(prognosis_readings_payload, **upload_options)
+    if _datapoint_registry is not None:
+        _datapoint_registry.set_last_prognosis_id(prognosis_payload.get("datapointId"), response["id"])
+
+    return {**response, "readings": reading_results}
+
+# Skip or tail-append a prognosis that barely differs from the last one.
+# Returns None when a full upload is needed.
+def _post_prognosis_changes(prognosis_payload, tolerance, append_tail, upload_options):
+    dp_id = prognosis_payload.get("datapointId")
+    dp = _datapoint_registry.by_id(dp_id) if _datapoint_registry is not None else None
+    if dp is not None:
+        dp = _datapoint_registry.get(dp["identifier"], max_age=_prognosis_max_age)
+    else:
+        dp = (Q().filter(id__equals=dp_id).paginate(page=0, size=1).get("/datapoints") or [None])[0]
+    last_prognosis_id = dp.get("lastPrognosisId") if dp else None
+    if last_prognosis_id is None:
+        return None
 
-# POST datapoint reading
+    previous = (
+        Q()
+        .filter(datapointPrognosisId__equals=last_prognosis_id)
+        .paginate(page=0, size=10000)
+        .get("/prognosis-readings")
+    )
+    if not previous:
+        return None
+    diff = Util.diff_prognosis(previous, prognosis_payload["readings"], tolerance)
+
+    if diff["changed"] == 0:
+        _logger.info("Prognosis of datapoint %s unchanged within %s, upload skipped", dp_id, tolerance)
+        return {"id": last_prognosis_id, "upload": "skipped", "readings": []}
+    if append_tail and diff["overlap_changed"] == 0:
+        tail = [{**r, "datapointPrognosisId": last_prognosis_id} for r in diff["tail"]]
+        _logger.info("Prognosis of datapoint %s: appending %d new readings to prognosis %s",
+                     dp_id, len(tail), last_prognosis_id)
+        reading_results = post_prognosis_readings(tail, **upload_options)
+        return {"id": last_prognosis_id, "upload": "tail", "readings": reading_results}
+    _logger.debug("Prognosis of datapoint %s: %d readings changed, uploading new prognosis",
+                  dp_id, diff["changed"])
+    return None
+
+# POST datapoint reading (a datetime "time" is sent as an ISO-8601 UTC string)
 def post_datapoint_reading(datapoint_reading_payload):
+    datapoint_reading_payload = format_times([datapoint_reading_payload])[0]
     response = (Q().post("/readings", json=datapoint_reading_payload))
 
     return response
@@ -375,3 +958,49 @@ def post_datapoint_ctrl_status_sent(ctrl_status_sent_payload):
     response = (Q().post("/control-values/set-sent", json=ctrl_status_sent_payload))
 
     return response
+
+##########################################################
+# Buffered (write-behind) POST
+##########################################################
+
+# Queue readings / control values and send them from a background thread
+# (see write_buffer.WriteBuffer), so the caller does not wait on each POST.
+# options: batch_size, flush_interval, max_in_flight, max_pending, coalesce
+# (endpoints where a newer value replaces a still queued one of the same
+# datapoint; default control values only), batch_endpoints ({endpoint: bulk
+# endpoint accepting a JSON list}) and on_failure(endpoint, payload).
+def enable_write_buffer(**options):
+    global _write_buffer
+    if _write_buffer is not None:
+        close_write_buffer()
+    options.setdefault("logger", _logger)
+    _write_buffer = WriteBuffer(lambda endpoint, payload: Q().post(endpoint, json=payload), **options)
+    return _write_buffer
+
+def get_write_buffer():
+    return _write_buffer if _write_buffer is not None else enable_write_buffer()
+
+# Queue a datapoint reading; enables the write buffer with defaults if needed
+def queue_datapoint_reading(datapoint_reading_payload):
+    get_write_buffer().submit("/readings", format_times([datapoint_reading_payload])[0])
+
+# Queue a datapoint control value; a newer value for the same datapoint
+# replaces one that has not been sent yet
+def queue_datapoint_ctrl_value(datapoint_ctrl_val_payload):
+    get_write_buffer().submit("/control-values", datapoint_ctrl_val_payload)
+
+# Send all queued writes now and wait for them.
+# Returns the (endpoint, payload) pairs that have failed so far and clears them.
+def flush_writes(timeout=None):
+    if _write_buffer is None:
+        return []
+    if not _write_buffer.flush(timeout):
+        _logger.warning("flush_writes: queued writes were not all sent within %s s", timeout)
+    return _write_buffer.take_failures()
+
+# Send remaining queued writes and stop the write buffer
+def close_write_buffer(timeout=None):
+    global _write_buffer
+    if _write_buffer is not None:
+        _write_buffer.close(timeout)
+        _write_buffer = None
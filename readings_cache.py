@@ -0,0 +1,141 @@
+# readings_cache.py
+#
+# Persistent local cache of FULL readings, keyed by datapoint ID.
+#
+# Readings are kept in SQLite together with the time range each datapoint's
+# cache is known to be complete for ("coverage"). query_utils.get_readings
+# serves FULL requests inside the coverage from disk and only fetches
+# readings newer than the end of the coverage from the API. The coverage
+# ends just after the newest reading fetched, never at the request's end
+# time, so readings arriving later for times after it are still fetched.
+
+import sqlite3
+import threading
+from timestamps import epoch_us_many
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    datapoint_id INTEGER NOT NULL,
+    epoch_us     INTEGER NOT NULL,
+    id,
+    time         TEXT NOT NULL,
+    value,
+    PRIMARY KEY (datapoint_id, epoch_us, id)
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    datapoint_id INTEGER PRIMARY KEY,
+    from_us      INTEGER NOT NULL,
+    to_us        INTEGER NOT NULL
+);
+"""
+
+class ReadingsCache:
+    """SQLite-backed readings cache with delta fetch bookkeeping.
+
+    path:                   SQLite file, shared safely between processes
+    retention_seconds:      readings more than this before the end of the
+                            datapoint's coverage are evicted, so a historic
+                            range just fetched stays cached
+    max_rows_per_datapoint: keep at most this many newest readings per datapoint
+    refetch_seconds:        re-fetch this much before the end of the coverage on
+                            every delta fetch, to pick up late-arriving readings
+                            timestamped before the newest cached one
+    """
+    def __init__(self, path="readings_cache.sqlite", retention_seconds=14 * 24 * 3600,
+                 max_rows_per_datapoint=None, refetch_seconds=0):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self.max_rows_per_datapoint = max_rows_per_datapoint
+        self.refetch_seconds = refetch_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    # (from_us, to_us) the cache is complete for, or None
+    def coverage(self, datapoint_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT from_us, to_us FROM coverage WHERE datapoint_id = ?", (datapoint_id,)
+            ).fetchone()
+        return tuple(row) if row else None
+
+    # Start of the next delta fetch for a request starting at from_us, or
+    # from_us itself when the cache cannot serve the start of the range
+    def fetch_start(self, datapoint_id, from_us):
+        covered = self.coverage(datapoint_id)
+        if covered is None or not covered[0] <= from_us <= covered[1]:
+            return from_us
+        return max(from_us, covered[1] - int(self.refetch_seconds * 1_000_000))
+
+    # Cached readings with from_us <= time < to_us, ordered by time
+    def read(self, datapoint_id, from_us, to_us):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, time, value FROM readings "
+                "WHERE datapoint_id = ? AND epoch_us >= ? AND epoch_us < ? ORDER BY epoch_us",
+                (datapoint_id, from_us, to_us),
+            ).fetchall()
+        return [{"id": r[0], "time": r[1], "value": r[2], "datapointId": datapoint_id} for r in rows]
+
+    # Store readings fetched for [from_us, to_us) and extend the coverage.
+    # A range that does not touch the current coverage replaces it.
+    def store(self, datapoint_id, readings, from_us, to_us):
+        times = epoch_us_many([r["time"] for r in readings]).tolist()
+        rows = [(datapoint_id, t, r.get("id"), r["time"], r.get("value")) for t, r in zip(times, readings)]
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT from_us, to_us FROM coverage WHERE datapoint_id = ?", (datapoint_id,)
+            ).fetchone()
+            if row and from_us <= row[1] and to_us >= row[0]:
+                from_us, to_us = min(from_us, row[0]), max(to_us, row[1])
+            else:
+                self._conn.execute("DELETE FROM readings WHERE datapoint_id = ?", (datapoint_id,))
+            self._conn.executemany("INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO coverage VALUES (?, ?, ?)", (datapoint_id, from_us, to_us)
+            )
+
+    # Apply retention_seconds and max_rows_per_datapoint to one datapoint
+    def evict(self, datapoint_id):
+        with self._lock, self._conn:
+            self._evict(datapoint_id)
+
+    def _evict(self, datapoint_id):
+        cutoff = None
+        if self.retention_seconds is not None:
+            row = self._conn.execute(
+                "SELECT to_us FROM coverage WHERE datapoint_id = ?", (datapoint_id,)
+            ).fetchone()
+            if row is not None:
+                cutoff = row[0] - int(self.retention_seconds * 1_000_000)
+        if self.max_rows_per_datapoint is not None:
+            row = self._conn.execute(
+                "SELECT epoch_us FROM readings WHERE datapoint_id = ? "
+                "ORDER BY epoch_us DESC LIMIT 1 OFFSET ?",
+                (datapoint_id, self.max_rows_per_datapoint - 1),
+            ).fetchone()
+            if row is not None:
+                cutoff = row[0] if cutoff is None else max(cutoff, row[0])
+        if cutoff is None:
+            return
+        self._conn.execute(
+            "DELETE FROM readings WHERE datapoint_id = ? AND epoch_us < ?", (datapoint_id, cutoff)
+        )
+        self._conn.execute(
+            "UPDATE coverage SET from_us = MAX(from_us, ?) WHERE datapoint_id = ?", (cutoff, datapoint_id)
+        )
+        self._conn.execute("DELETE FROM coverage WHERE datapoint_id = ? AND from_us >= to_us", (datapoint_id,))
+
+    def clear(self, datapoint_id=None):
+        with self._lock, self._conn:
+            if datapoint_id is None:
+                self._conn.execute("DELETE FROM readings")
+                self._conn.execute("DELETE FROM coverage")
+            else:
+                self._conn.execute("DELETE FROM readings WHERE datapoint_id = ?", (datapoint_id,))
+                self._conn.execute("DELETE FROM coverage WHERE datapoint_id = ?", (datapoint_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,225 @@
+# retrieval_modes.py
+#
+# Local, vectorised implementation of the /readings retrieval modes listed in
+# the query_utils.get_readings table. Every mode is computed from the FULL
+# readings of a window, so one download can serve any number of modes and
+# interval sizes.
+#
+# Buckets / boundaries are from_time + k * interval_seconds for every
+# boundary before to_time; bucket k covers [boundary_k, boundary_k+1).
+# Aggregated values are stamped with their bucket's start time; modes that
+# select stored readings (DELTA, BEST_FIT, EDGE_DETECTION, ...) keep the
+# readings' own timestamps. NaN (null) values are ignored.
+#
+# Readings outside [from_time, to_time) are ignored too, except that the
+# carry-forward modes (CARRY_IN_MODES) use the last reading before from_time
+# and END_BOUND the first reading at or after to_time when the series
+# contains them, so the first / last boundary has a value to take.
+
+import numpy as np
+from TimeSeries import TimeSeries
+
+INTERVAL_MODES = {
+    "CYCLIC", "INTERPOLATED", "BEST_FIT", "AVERAGE", "MINIMUM", "MAXIMUM",
+    "INTEGRAL", "SLOPE", "COUNTER", "VALUE_STATE", "PREDICTIVE",
+    "START_BOUND", "END_BOUND",
+}
+MODES = INTERVAL_MODES | {"FULL", "DELTA", "ROUND_TRIP", "EDGE_DETECTION"}
+CARRY_IN_MODES = {"CYCLIC", "START_BOUND", "VALUE_STATE"}
+
+_US = 1_000_000
+
+def compute(series, retrieval_mode, from_us, to_us, interval_seconds=None,
+            rollover_value=None, edge_type=None):
+    """Apply one retrieval mode to FULL readings in [from_us, to_us).
+
+    series: TimeSeries of the window's FULL readings, optionally plus the
+        last reading before from_us and the first at or after to_us
+    Returns a TimeSeries with the mode's output points.
+    """
+    mode = (retrieval_mode or "FULL").upper()
+    if mode not in MODES:
+        raise ValueError(f"Unknown retrieval mode {retrieval_mode}")
+    if mode in INTERVAL_MODES and (interval_seconds is None or interval_seconds <= 0):
+        raise ValueError(f"Retrieval mode {mode} requires a positive interval_seconds")
+
+    series = series.sorted()
+    t, v = series.to_numpy()
+    valid = ~np.isnan(v)
+    t, v = t[valid], v[valid]
+    first = np.searchsorted(t, from_us, side="left")
+    last = np.searchsorted(t, to_us, side="left")
+    if mode in CARRY_IN_MODES:
+        first = max(first - 1, 0)
+    elif mode == "END_BOUND":
+        last = min(last + 1, len(t))
+    t, v = t[first:last], v[first:last]
+
+    if mode == "FULL":
+        out_t, out_v = t, v
+    elif mode == "DELTA":
+        changed = np.ones(len(v), dtype=bool)
+        changed[1:] = v[1:] != v[:-1]
+        out_t, out_v = t[changed], v[changed]
+    elif mode == "ROUND_TRIP":
+        rising = _edges(v, rising=True)
+        edge_t = t[rising]
+        out_t, out_v = edge_t[1:], np.diff(edge_t) / _US
+    elif mode == "EDGE_DETECTION":
+        out_t, out_v = _edge_detection(t, v, edge_type)
+    else:
+        iv = int(round(interval_seconds * _US))
+        boundaries = from_us + np.arange(max(0, -(-(to_us - from_us) // iv)), dtype=np.int64) * iv
+        if len(boundaries):
+            out_t, out_v = _INTERVAL_FUNCS[mode](t, v, boundaries, iv, to_us, rollover_value)
+        else:
+            out_t, out_v = t[:0], v[:0]
+
+    return TimeSeries(out_t, out_v, series.datapoint_id)
+
+def _edges(v, rising):
+    # Indices of readings where the signal crosses threshold 0 (low -> high if rising)
+    idx = np.zeros(len(v), dtype=bool)
+    if rising:
+        idx[1:] = (v[:-1] <= 0) & (v[1:] > 0)
+    else:
+        idx[1:] = (v[:-1] > 0) & (v[1:] <= 0)
+    return idx
+
+def _edge_detection(t, v, edge_type):
+    edge_type = (edge_type or "BOTH").upper()
+    rising = _edges(v, rising=True) if edge_type in ("BOTH", "LEADING") else np.zeros(len(v), dtype=bool)
+    falling = _edges(v, rising=False) if edge_type in ("BOTH", "TRAILING") else np.zeros(len(v), dtype=bool)
+    out = rising.astype(np.float64) - falling.astype(np.float64)
+    mask = rising | falling
+    return t[mask], out[mask]
+
+def _groups(t, boundaries, iv):
+    """Bucket of every reading plus (bucket ids, start, end) index of each non-empty bucket."""
+    bucket = (t - boundaries[0]) // iv
+    if not len(bucket):
+        empty = np.zeros(0, dtype=np.int64)
+        return bucket, empty, empty, empty
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)]
+    return bucket, bucket[starts], starts, ends
+
+def _average(t, v, boundaries, iv, to_us, rollover_value):
+    _, ids, starts, ends = _groups(t, boundaries, iv)
+    if not len(ids):
+        return ids, np.zeros(0)
+    return boundaries[ids], np.add.reduceat(v, starts) / (ends - starts)
+
+def _minimum(t, v, boundaries, iv, to_us, rollover_value):
+    _, ids, starts, _ = _groups(t, boundaries, iv)
+    if not len(ids):
+        return ids, np.zeros(0)
+    return boundaries[ids], np.minimum.reduceat(v, starts)
+
+def _maximum(t, v, boundaries, iv, to_us, rollover_value):
+    _, ids, starts, _ = _groups(t, boundaries, iv)
+    if not len(ids):
+        return ids, np.zeros(0)
+    return boundaries[ids], np.maximum.reduceat(v, starts)
+
+def _best_fit(t, v, boundaries, iv, to_us, rollover_value):
+    bucket, ids, starts, ends = _groups(t, boundaries, iv)
+    if not len(ids):
+        return t[:0], v[:0]
+    order = np.lexsort((v, bucket))  # by bucket, then value
+    picked = np.unique(np.r_[order[starts], order[ends - 1]])  # min and max of each bucket, time order
+    return t[picked], v[picked]
+
+def _integral(t, v, boundaries, iv, to_us, rollover_value):
+    # Trapezoidal area of the linearly interpolated signal over the part of
+    # each bucket between the first and last reading; a segment crossing a
+    # boundary is split there at the interpolated value
+    if len(t) < 2:
+        return t[:0], v[:0]
+    area_before = np.r_[0.0, np.cumsum((v[1:] + v[:-1]) / 2 * np.diff(t))]  # area from t[0] to t[i]
+
+    def area(x):
+        j = np.clip(np.searchsorted(t, x, side="right") - 1, 0, len(t) - 2)
+        vx = np.interp(x, t, v)
+        return area_before[j] + (v[j] + vx) / 2 * (x - t[j])
+
+    lo = np.maximum(boundaries, t[0])
+    hi = np.minimum(np.minimum(boundaries + iv, to_us), t[-1])
+    ok = hi > lo
+    return boundaries[ok], (area(hi[ok]) - area(lo[ok])) / _US
+
+def _slope(t, v, boundaries, iv, to_us, rollover_value):
+    # (last - first) / elapsed seconds of each bucket with at least two distinct times
+    _, ids, starts, ends = _groups(t, boundaries, iv)
+    if not len(ids):
+        return ids, np.zeros(0)
+    dt = (t[ends - 1] - t[starts]) / _US
+    ok = dt > 0
+    return boundaries[ids[ok]], (v[ends - 1] - v[starts])[ok] / dt[ok]
+
+def _counter(t, v, boundaries, iv, to_us, rollover_value):
+    # Sum of steps between consecutive readings, credited to the later reading's bucket
+    bucket, ids, _, _ = _groups(t, boundaries, iv)
+    if not len(ids):
+        return ids, np.zeros(0)
+    steps = np.diff(v)
+    if rollover_value is not None:
+        steps = np.where(steps < 0, steps + rollover_value, steps)
+    totals = np.bincount(bucket[1:], weights=steps, minlength=len(boundaries))
+    return boundaries[ids], totals[ids]
+
+def _value_state(t, v, boundaries, iv, to_us, rollover_value):
+    # Time-weighted mean of the step (carry-forward) signal over each bucket,
+    # counting only the part of the bucket after the first (seed) reading
+    if not len(t):
+        return t, v
+    area_before = np.r_[0.0, np.cumsum(v[:-1] * np.diff(t))]  # area from t[0] to t[i]
+
+    def area(x):
+        j = np.searchsorted(t, x, side="right") - 1
+        return area_before[j] + v[j] * (x - t[j])
+
+    lo = np.maximum(boundaries, t[0])
+    hi = np.minimum(boundaries + iv, to_us)
+    ok = hi > lo
+    lo, hi = lo[ok], hi[ok]
+    return boundaries[ok], (area(hi) - area(lo)) / (hi - lo)
+
+def _start_bound(t, v, boundaries, iv, to_us, rollover_value):
+    j = np.searchsorted(t, boundaries, side="right") - 1
+    ok = j >= 0
+    return boundaries[ok], v[j[ok]]
+
+def _end_bound(t, v, boundaries, iv, to_us, rollover_value):
+    j = np.searchsorted(t, boundaries, side="right")
+    ok = j < len(t)
+    return boundaries[ok], v[j[ok]]
+
+def _interpolated(t, v, boundaries, iv, to_us, rollover_value):
+    if not len(t):
+        return t, v
+    ok = (boundaries >= t[0]) & (boundaries <= t[-1])
+    return boundaries[ok], np.interp(boundaries[ok], t, v)
+
+def _predictive(t, v, boundaries, iv, to_us, rollover_value):
+    if len(np.unique(t)) < 2:
+        return t[:0], v[:0]
+    origin = boundaries[0]
+    slope, intercept = np.polyfit((t - origin) / _US, v, 1)
+    return boundaries, intercept + slope * (boundaries - origin) / _US
+
+_INTERVAL_FUNCS = {
+    "CYCLIC": _start_bound,
+    "START_BOUND": _start_bound,
+    "END_BOUND": _end_bound,
+    "INTERPOLATED": _interpolated,
+    "BEST_FIT": _best_fit,
+    "AVERAGE": _average,
+    "MINIMUM": _minimum,
+    "MAXIMUM": _maximum,
+    "INTEGRAL": _integral,
+    "SLOPE": _slope,
+    "COUNTER": _counter,
+    "VALUE_STATE": _value_state,
+    "PREDICTIVE": _predictive,
+}
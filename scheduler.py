@@ -0,0 +1,120 @@
+# scheduler.py
+#
+# In-process cron scheduler for daemon mode.
+#
+# Parses the 6-field cron expressions used in the app config
+# ("second minute hour day-of-month month day-of-week", e.g. "15 */15 * * * *")
+# and runs a job on that schedule inside one long-lived process.
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime, timedelta
+
+_NAMES = {
+    4: {m: i + 1 for i, m in enumerate(
+        ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"])},
+    5: {d: i for i, d in enumerate(["SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"])},
+}
+_RANGES = ((0, 59), (0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+class CronSchedule:
+    """6-field cron expression: second minute hour day-of-month month day-of-week.
+
+    Supports "*", "?", lists ("1,5"), ranges ("1-5"), steps ("*/15", "10-40/10")
+    and month / weekday names. Day-of-week 0 and 7 are Sunday. Like Spring
+    cron, day-of-month and day-of-week must both match. Times are local.
+    """
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 6:
+            raise ValueError(f"Cron expression must have 6 fields, got {len(fields)}: {expression!r}")
+        self.expression = expression
+        self.seconds, self.minutes, self.hours, self.days, self.months, weekdays = (
+            _parse_field(field, i) for i, field in enumerate(fields)
+        )
+        self.weekdays = {d % 7 for d in weekdays}
+
+    def matches_day(self, dt):
+        # Python weekday(): Monday=0 .. Sunday=6; cron: Sunday=0
+        return dt.day in self.days and (dt.weekday() + 1) % 7 in self.weekdays
+
+    # First time strictly after dt (truncated to whole seconds) that matches
+    def next_after(self, dt):
+        dt = dt.replace(microsecond=0) + timedelta(seconds=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0, second=0) + timedelta(days=32)).replace(day=1)
+            elif not self.matches_day(dt):
+                dt = dt.replace(hour=0, minute=0, second=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0, second=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt = dt.replace(second=0) + timedelta(minutes=1)
+            elif dt.second not in self.seconds:
+                dt = dt + timedelta(seconds=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+def _parse_field(field, index):
+    low, high = _RANGES[index]
+    names = _NAMES.get(index, {})
+    values = set()
+    for part in field.upper().split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Invalid cron step in {field!r}")
+        if part in ("*", "?"):
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = _value(start_text, names), _value(end_text, names)
+        else:
+            start = _value(part, names)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field {field!r} out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+def _value(text, names):
+    return names[text] if text in names else int(text)
+
+def run_forever(job, schedule, run_timeout=None, logger=None, stop_event=None):
+    """Run job() at every tick of schedule until stop_event is set.
+
+    Runs never overlap: ticks that pass while a run is active are skipped.
+    A run taking longer than run_timeout seconds is reported; since a Python
+    thread cannot be killed it keeps going, and later ticks are skipped until
+    it finishes. Exceptions from job() are logged and the daemon keeps going.
+    """
+    logger = logger or logging.getLogger(__name__)
+    stop_event = stop_event or threading.Event()
+    if isinstance(schedule, str):
+        schedule = CronSchedule(schedule)
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cron-run")
+    running = None
+    next_run = schedule.next_after(datetime.now())
+    logger.info(f"Scheduler started ({schedule.expression}), next run at {next_run}")
+    try:
+        while not stop_event.wait(max(0.0, (next_run - datetime.now()).total_seconds())):
+            if running is not None and not running.done():
+                logger.warning(f"Skipping run at {next_run}: previous run is still active")
+            else:
+                running = executor.submit(job)
+                try:
+                    running.result(timeout=run_timeout)
+                except TimeoutError:
+                    logger.error(f"Run started at {next_run} exceeded run timeout of {run_timeout} s")
+                except Exception:
+                    logger.exception(f"Run started at {next_run} failed")
+            next_run = schedule.next_after(max(datetime.now(), next_run))
+    finally:
+        executor.shutdown(wait=False)
+    logger.info("Scheduler stopped")
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import numpy as np
+
+# ISO-8601 timestamp codec shared by TimeSeries, Util, query_utils and the
+# readings cache. Times are carried as int64 microseconds since the Unix
+# epoch (UTC); API strings are "YYYY-MM-DDTHH:MM:SS[.ffffff]Z" or with an
+# explicit offset. Naive datetimes and strings without an offset are UTC.
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ONE_US = timedelta(microseconds=1)
+
+@lru_cache(maxsize=65536)
+def _parse_str(value):
+    # Python < 3.11 fromisoformat does not accept "Z"
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return (parsed - _EPOCH) // _ONE_US
+
+def epoch_us(time_val):
+    """ISO-8601 string or datetime -> integer microseconds since the Unix epoch.
+
+    Naive datetimes (and strings without an offset) are taken as UTC. Parsed
+    strings are cached, so repeated timestamps are only parsed once.
+    """
+    if isinstance(time_val, str):
+        return _parse_str(time_val)
+    if not isinstance(time_val, datetime):
+        raise TypeError("time must be string or datetime")
+    if time_val.tzinfo is None:
+        time_val = time_val.replace(tzinfo=timezone.utc)
+    return (time_val - _EPOCH) // _ONE_US
+
+def _utc_wall_time(value):
+    # "...Z" / "...+00:00" -> naive string numpy can parse; anything else -> ValueError
+    if value[-1] == "Z":
+        value = value[:-1]
+    elif value[-6:] == "+00:00":
+        value = value[:-6]
+    if "+" in value or "-" in value[10:]:
+        raise ValueError("non-UTC offset")
+    return value
+
+def epoch_us_many(time_vals):
+    """Sequence of ISO-8601 strings / datetimes -> int64 array of epoch microseconds.
+
+    UTC strings (the API's "Z" form) are parsed by numpy in one pass; mixed
+    input, datetimes and other offsets fall back to epoch_us per element.
+    """
+    count = len(time_vals)
+    if not count:
+        return np.empty(0, dtype=np.int64)
+    try:
+        wall = [_utc_wall_time(value) for value in time_vals]
+        return np.array(wall, dtype="datetime64[us]").view(np.int64)
+    except (TypeError, ValueError, IndexError):
+        return np.fromiter((epoch_us(value) for value in time_vals), dtype=np.int64, count=count)
+
+def from_epoch_us(value):
+    """Integer microseconds since the Unix epoch -> aware UTC datetime."""
+    return _EPOCH + timedelta(microseconds=int(value))
+
+def from_epoch_us_many(values):
+    """Epoch-microsecond array -> list of aware UTC datetimes."""
+    return [_EPOCH + timedelta(microseconds=v) for v in np.asarray(values, dtype=np.int64).tolist()]
+
+def format_epoch_us(value):
+    """Integer microseconds since the Unix epoch -> ISO-8601 UTC string ("...Z")."""
+    return from_epoch_us(value).isoformat().replace("+00:00", "Z")
+
+def format_epoch_us_many(values):
+    """Epoch-microsecond array -> list of ISO-8601 UTC strings, formatted by numpy in one pass.
+
+    Seconds precision when every value is a whole second (as format_epoch_us),
+    microseconds otherwise.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return []
+    unit = "s" if not (values % 1_000_000).any() else "us"
+    return [text + "Z" for text in np.datetime_as_string(values.view("datetime64[us]"), unit=unit).tolist()]
+
+def format_times(items, key="time"):
+    """Dicts whose key holds a datetime or epoch-microsecond int get it as an ISO-8601 "Z" string.
+
+    Returns a new list; dicts that already have string times are passed through
+    unchanged, the others are shallow-copied.
+    """
+    items = list(items)
+    pending = [i for i, item in enumerate(items) if not isinstance(item.get(key), (str, type(None)))]
+    if not pending:
+        return items
+    texts = format_epoch_us_many([
+        items[i][key] if isinstance(items[i][key], (int, np.integer)) else epoch_us(items[i][key])
+        for i in pending
+    ])
+    for i, text in zip(pending, texts):
+        items[i] = {**items[i], key: text}
+    return items
@@ -0,0 +1,180 @@
+# token_manager.py
+#
+# Access token reuse across runs.
+#
+# The token and its expiry are kept in a small JSON file so every run (or
+# every process of a site) reuses the same JWT until shortly before it
+# expires, instead of calling /auth/token on each start.
+
+import base64
+import json
+import logging
+import os
+import stat
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)  # not on Windows
+
+# Create directory path (mode 0700) if it is missing and check that it is a
+# real directory owned by the current user and closed to everyone else, so
+# no other local user can plant or read a cached token there. Raises
+# PermissionError otherwise. Ownership and mode are not checked on Windows.
+def ensure_private_dir(path):
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise PermissionError(f"{path} is not a directory")
+    if hasattr(os, "getuid"):
+        if st.st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by uid {st.st_uid}, not by the current user")
+        if st.st_mode & 0o077:
+            raise PermissionError(f"{path} must only be accessible by its owner (mode 0700), "
+                                  f"has mode {stat.S_IMODE(st.st_mode):o}")
+    return path
+
+class TokenManager:
+    """Caches an access token on disk and refreshes it before it expires.
+
+    fetch_token:    callable returning the /auth/token response dict
+                    ({"access_token": ..., "expires_in": ...})
+    cache_path:     JSON file holding the token; a "<cache_path>.lock" file
+                    serialises refreshes between processes
+    refresh_margin: seconds before expiry at which the token is renewed
+    """
+    def __init__(self, fetch_token, cache_path="token_cache.json", refresh_margin=300, logger=None):
+        self.fetch_token = fetch_token
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.logger = logger or logging.getLogger(__name__)
+        self._token = None
+        self._expires_at = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Current token, refreshed first if it is missing or about to expire
+    def get_token(self):
+        with self._lock:
+            if self._valid(self._token, self._expires_at):
+                return self._token
+            with self._file_lock():
+                token, expires_at = self._read_cache()
+                if not self._valid(token, expires_at):
+                    token, expires_at = self._fetch()
+                self._token, self._expires_at = token, expires_at
+            return self._token
+
+    # Force a new token, e.g. after a 401. If another thread or process
+    # already replaced stale_token, its newer token is used instead.
+    def refresh(self, stale_token=None):
+        with self._lock:
+            with self._file_lock():
+                token, expires_at = self._read_cache()
+                if token is None or token == stale_token or not self._valid(token, expires_at):
+                    token, expires_at = self._fetch()
+                self._token, self._expires_at = token, expires_at
+            return self._token
+
+    # Renew the token in a background thread for long-lived processes
+    def start_auto_refresh(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._auto_refresh, name="TokenManager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _auto_refresh(self):
+        while not self._stop.is_set():
+            try:
+                self.get_token()
+                expires_at = self._expires_at
+                wait = 60 if expires_at is None else max(1, expires_at - self.refresh_margin - time.time())
+            except Exception as e:
+                self.logger.error(f"Token refresh failed: {e}")
+                wait = 30
+            self._stop.wait(wait)
+
+    def _valid(self, token, expires_at):
+        if token is None:
+            return False
+        return expires_at is None or time.time() < expires_at - self.refresh_margin
+
+    def _fetch(self):
+        token_data = self.fetch_token()
+        if not token_data or "access_token" not in token_data:
+            raise RuntimeError("Failed to obtain access token")
+        token = token_data["access_token"]
+        if token_data.get("expires_in") is not None:
+            expires_at = time.time() + float(token_data["expires_in"])
+        else:
+            expires_at = _jwt_expiry(token)
+        self._write_cache(token, expires_at)
+        self.logger.debug("Fetched new access token, expires at %s", expires_at)
+        return token, expires_at
+
+    def _read_cache(self):
+        try:
+            with os.fdopen(os.open(self.cache_path, os.O_RDONLY | _NOFOLLOW), "r") as f:
+                data = json.load(f)
+            return data.get("access_token"), data.get("expires_at")
+        except (OSError, ValueError):
+            return None, None
+
+    def _write_cache(self, token, expires_at):
+        tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+        try:
+            try:
+                os.unlink(tmp_path)  # left over by a crashed process with the same pid
+            except FileNotFoundError:
+                pass
+            # A fresh file of our own, never an existing file or a symlink planted there
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | _NOFOLLOW, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.logger.warning(f"Could not persist access token to {self.cache_path}: {e}")
+
+    def _file_lock(self):
+        return _FileLock(f"{self.cache_path}.lock")
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | _NOFOLLOW, 0o600)
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+            except OSError:
+                self.fd = None
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+# "exp" claim of a JWT, or None if the token is not a readable JWT
+def _jwt_expiry(token):
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
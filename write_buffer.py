@@ -0,0 +1,155 @@
+# write_buffer.py
+
+import atexit
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class WriteBuffer:
+    """Write-behind buffer for POSTs of readings and control values.
+
+    submit() only queues the payload, so the caller never waits on the
+    network. A background thread sends everything queued once batch_size
+    payloads are waiting or every flush_interval seconds, with up to
+    max_in_flight requests open at once. Payloads of one datapoint are always
+    sent in submit order, one after another; different datapoints are sent
+    concurrently. For endpoints listed in coalesce, a payload replaces a still
+    queued one of the same datapoint (last write wins). Payloads the API
+    rejected are kept in self.failed as (endpoint, payload) and passed to
+    on_failure if given. Remaining payloads are sent on close() and at exit.
+    """
+    def __init__(self, send, batch_size=100, flush_interval=1.0, max_in_flight=8,
+                 max_pending=10000, coalesce=("/control-values",), batch_endpoints=None,
+                 on_failure=None, logger=None):
+        self.send = send  # send(endpoint, payload) -> response, or None on failure
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.coalesce = set(coalesce or ())
+        self.batch_endpoints = dict(batch_endpoints or {})
+        self.on_failure = on_failure
+        self.logger = logger or logging.getLogger(__name__)
+        self.failed = []
+        self.sent = 0
+        self.coalesced = 0
+        self._pending = []   # [endpoint, datapoint id, payload] in submit order
+        self._latest = {}    # (endpoint, datapoint id) -> queued entry, for coalescing
+        self._unfinished = 0
+        self._flush_requested = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="WriteBuffer")
+        self._thread = threading.Thread(target=self._run, name="WriteBuffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, endpoint, payload):
+        # Blocks only while max_pending payloads are already queued
+        dp_id = payload.get("datapointId") if isinstance(payload, dict) else None
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("WriteBuffer is closed")
+            key = (endpoint, dp_id)
+            if endpoint in self.coalesce and dp_id is not None and key in self._latest:
+                self._latest[key][2] = payload
+                self.coalesced += 1
+                return
+            while len(self._pending) >= self.max_pending and not self._stopped:
+                self._cond.wait()
+            entry = [endpoint, dp_id, payload]
+            self._pending.append(entry)
+            self._latest[key] = entry
+            self._unfinished += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        # Send everything queued so far now and wait for it; True if all was sent in time
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._unfinished or not self._thread.is_alive(), timeout)
+
+    def take_failures(self):
+        # (endpoint, payload) pairs that failed since the last call
+        with self._cond:
+            failed, self.failed = self.failed, []
+        return failed
+
+    def close(self, timeout=None):
+        with self._cond:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._cond.notify_all()
+        atexit.unregister(self.close)  # don't keep a closed buffer alive until exit
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+        if self.failed:
+            self.logger.error("WriteBuffer: %d payloads failed to send", len(self.failed))
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopped or self._flush_requested or len(self._pending) >= self.batch_size,
+                    self.flush_interval,
+                )
+                entries, self._pending, self._latest = self._pending, [], {}
+                self._flush_requested = False
+                stopping = self._stopped
+                self._cond.notify_all()  # wake submitters waiting on max_pending
+            if entries:
+                self._send_all(entries)
+                with self._cond:
+                    self._unfinished -= len(entries)
+                    self._cond.notify_all()
+            elif stopping:
+                return
+
+    def _send_all(self, entries):
+        # One task per group of datapoints; a datapoint's payloads never span tasks
+        lanes = {}
+        for endpoint, dp_id, payload in entries:
+            lanes.setdefault((endpoint, dp_id), []).append(payload)
+        tasks = []
+        for (endpoint, _), payloads in lanes.items():
+            if endpoint in self.batch_endpoints and tasks and tasks[-1][0] == endpoint \
+                    and len(tasks[-1][1]) < self.batch_size:
+                tasks[-1][1].extend(payloads)
+            else:
+                tasks.append((endpoint, payloads))
+        failures = [f for batch in self._executor.map(self._send_task, tasks) for f in batch]
+        with self._cond:
+            self.sent += len(entries) - len(failures)
+            self.failed.extend(failures)
+        if failures:
+            self.logger.error("WriteBuffer: %d of %d payloads failed to send", len(failures), len(entries))
+            if self.on_failure is not None:
+                for endpoint, payload in failures:
+                    try:
+                        self.on_failure(endpoint, payload)
+                    except Exception as e:
+                        self.logger.error(f"WriteBuffer on_failure callback failed: {e}")
+
+    def _send_task(self, task):
+        endpoint, payloads = task
+        failures = []
+        bulk_endpoint = self.batch_endpoints.get(endpoint)
+        if bulk_endpoint is None:
+            for payload in payloads:
+                if self._send(endpoint, payload) is None:
+                    failures.append((endpoint, payload))
+            return failures
+        for i in range(0, len(payloads), self.batch_size):
+            batch = payloads[i:i + self.batch_size]
+            if self._send(bulk_endpoint, batch) is None:
+                failures.extend((endpoint, payload) for payload in batch)
+        return failures
+
+    def _send(self, endpoint, payload):
+        try:
+            return self.send(endpoint, payload)
+        except Exception as e:
+            self.logger.error(f"WriteBuffer: POST {endpoint} failed: {e}")
+            return None